@@ -0,0 +1,216 @@
+import io
+import threading
+import numpy as np
+import pandas as pd
+import Store
+import Responses
+import Database
+
+"""
+Sentiment aggregation over the evaluation results. Scores in results/post_eval.csv are joined with
+the post store on URL and reduced to running sums per time bucket (of the post's ts) and per user,
+from which the mean and signed-RMS optimism (same formulas as Analyzer.calculateCityPolitics /
+calculatePublicationPolitics) and their karma- and comment-weighted variants are derived.
+
+The sums live in results/aggregates.sqlite together with how far into post_eval.csv they've read,
+so each update only parses the rows appended since the last one; rolling windows are computed
+from the (small) bucket table. Each URL's own contribution (summands, bucket, user) is kept too, so
+a URL scored again later (re-evaluated post, re-ingested batch) replaces its earlier score instead
+of counting twice, and rows whose post isn't in the store yet wait in a pending table until it is.
+Karma/comment weights are the store's values when a row is ingested, call rebuild() after a big
+stats refresh to reweight everything.
+
+@author Victor Gong
+@version 10/18/2026
+"""
+
+evalFileName = "results/post_eval.csv" #Same as Analyzer.EvalFileName
+aggregateFileName = "results/aggregates.sqlite"
+
+BUCKET = "1h" #Time bucket of the running sums (rolling windows are multiples of this)
+SUM_COLUMNS = ("n", "sumX", "sumSq", "sumK", "sumKX", "sumKSq", "sumC", "sumCX", "sumCSq")
+FULL_SCAN_ROWS = 50000 #New rows above which the whole store is scanned instead of looking URLs up
+
+SUM_SQL = ", ".join(c + " REAL" for c in SUM_COLUMNS)
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS buckets (bucket TEXT PRIMARY KEY, " + SUM_SQL + ")",
+    "CREATE TABLE IF NOT EXISTS users (user TEXT PRIMARY KEY, " + SUM_SQL + ")",
+    "CREATE TABLE IF NOT EXISTS contributions (url TEXT PRIMARY KEY, bucket TEXT, user TEXT, " + SUM_SQL + ")",
+    "CREATE TABLE IF NOT EXISTS pending (url TEXT PRIMARY KEY, response TEXT, score REAL, parsed REAL)",
+    "CREATE TABLE IF NOT EXISTS progress (fileName TEXT PRIMARY KEY, offset INTEGER)",
+)
+
+_local = threading.local()
+
+
+def getConnection():
+    return Database.connect(_local, aggregateFileName, SCHEMA)
+
+"""
+=========================================================
+                       FORMULAS
+=========================================================
+"""
+
+#Square root that keeps the sign of its argument: sqrt(|S|) * S/|S|
+def signedSqrt(values):
+    return np.sign(values) * np.sqrt(np.abs(values))
+
+#Mean and signed-RMS (plain, karma-weighted, comment-weighted) from summed columns, empty groups give NaN
+def metrics(sums):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return pd.DataFrame({
+            "count": sums["n"],
+            "mean": sums["sumX"] / sums["n"],
+            "signedRMS": signedSqrt(sums["sumSq"] / sums["n"]),
+            "karmaMean": sums["sumKX"] / sums["sumK"],
+            "karmaSignedRMS": signedSqrt(sums["sumKSq"] / sums["sumK"]),
+            "commentMean": sums["sumCX"] / sums["sumC"],
+            "commentSignedRMS": signedSqrt(sums["sumCSq"] / sums["sumC"]),
+        }, index=sums.index)
+
+#Per-row summands of every SUM_COLUMNS entry for scores x with karma/comment weights (negative weights count as 0)
+def summands(frame):
+    x = frame["rating"].to_numpy(float)
+    karma = frame["karma"].to_numpy(float).clip(min=0); comments = frame["comments"].to_numpy(float).clip(min=0)
+    sq = np.sign(x) * x * x #Squared, negatives added back as negative
+    return pd.DataFrame({"n": 1.0, "sumX": x, "sumSq": sq, "sumK": karma, "sumKX": karma*x, "sumKSq": karma*sq,
+                         "sumC": comments, "sumCX": comments*x, "sumCSq": comments*sq}, index=frame.index)
+
+"""
+=========================================================
+                       INGESTION
+=========================================================
+"""
+
+#Empty frame of url/response/score/parsed result rows
+def emptyResults():
+    return pd.DataFrame({"url": pd.Series(dtype=str), "response": pd.Series(dtype=str), "score": pd.Series(dtype=float), "parsed": pd.Series(dtype=float)})
+
+#Reads the eval .csv rows appended after byte offset, returns (frame of url/response/score/parsed, new offset)
+#Only whole lines are consumed, a row still being written is picked up next time
+def readNewResults(fileName, offset):
+    empty = emptyResults()
+    try:
+        with open(fileName, "rb") as f:
+            f.seek(offset); data = f.read()
+    except FileNotFoundError:
+        return empty, offset
+    data = data[:data.rfind(b"\n") + 1]
+    if not data: return empty, offset
+    frame = pd.read_csv(io.BytesIO(data), header=None, names=Responses.EVAL_COLUMNS,
+                        dtype={"url": str, "response": str, "score": float, "parsed": float}, keep_default_na=False, na_values={"score": [""], "parsed": [""]})
+    return frame.drop(columns="justification"), offset + len(data)
+
+#Typed scores of the rows, parsing the raw answer only for legacy (url, response) rows without typed columns
+def rowScores(frame):
+    scores = frame["score"].astype(float)
+    legacy = frame["parsed"].isna()
+    if legacy.any():
+        legacyScores = pd.to_numeric(frame.loc[legacy, "response"].str.extract(Responses.EVAL_REGEX)[0].str.replace("−", "-"), errors="coerce")
+        offScale = (legacyScores < Responses.SCORE_MIN - Responses.SCORE_TOLERANCE) | (legacyScores > Responses.SCORE_MAX + Responses.SCORE_TOLERANCE)
+        scores[legacy] = legacyScores.mask(offScale).clip(Responses.SCORE_MIN, Responses.SCORE_MAX)
+    return scores
+
+#Joins scored URLs with ts/karma/comments/user from the post store
+def joinPosts(frame):
+    columns = ["ts", "karma", "comments", "user"]
+    if len(frame) > FULL_SCAN_ROWS:
+        posts = pd.DataFrame.from_records(Store.loadPosts(["url"] + columns), columns=["url"] + columns)
+    else:
+        found = Store.getPosts(frame["url"], columns)
+        posts = pd.DataFrame.from_records([(url,) + row for url, row in found.items()], columns=["url"] + columns)
+    return frame.merge(posts, on="url", how="inner")
+
+#Adds grouped sums to a sums table (SQL upsert, existing sums are incremented)
+def addSums(table, key, grouped):
+    if grouped.empty: return
+    conn = getConnection()
+    assignments = ", ".join(c + "=" + c + "+excluded." + c for c in SUM_COLUMNS)
+    conn.executemany("INSERT INTO " + table + " VALUES (" + ",".join("?"*(len(SUM_COLUMNS)+1)) + ") ON CONFLICT(" + key + ") DO UPDATE SET " + assignments,
+                     grouped.reset_index().itertuples(index=False, name=None))
+
+#Adds (sign=1) or removes (sign=-1) per-URL contributions (url, bucket, user, SUM_COLUMNS...) to/from the bucket and user sums
+def applyContributions(contributions, sign):
+    if contributions.empty: return
+    addSums("buckets", "bucket", sign * contributions.groupby("bucket")[list(SUM_COLUMNS)].sum())
+    addSums("users", "user", sign * contributions.groupby("user")[list(SUM_COLUMNS)].sum())
+
+#Returns the stored contributions of the given URLs (those already in the sums)
+def loadContributions(urls):
+    columns = ["url", "bucket", "user"] + list(SUM_COLUMNS)
+    conn = getConnection(); rows = []
+    if conn.execute("SELECT 1 FROM contributions LIMIT 1").fetchone():
+        rows = Database.selectIn(conn, "SELECT * FROM contributions WHERE url IN ({})", urls)
+    return pd.DataFrame.from_records(rows, columns=columns)
+
+#Result rows left over from earlier updates because their post wasn't in the store yet
+def loadPending():
+    pending = pd.read_sql_query("SELECT url, response, score, parsed FROM pending", getConnection())
+    return pd.concat([emptyResults(), pending]).astype({"score": float, "parsed": float}) if not pending.empty else emptyResults()
+
+#Folds results appended to the eval .csv since the last update (and pending rows whose post is now stored) into the
+#running sums, replacing the contribution of URLs scored before; returns # of posts added or replaced
+def update(fileName=evalFileName):
+    conn = getConnection()
+    row = conn.execute("SELECT offset FROM progress WHERE fileName=?", (fileName,)).fetchone()
+    frame, offset = readNewResults(fileName, row[0] if row else 0)
+
+    frame = pd.concat([loadPending(), frame], ignore_index=True).drop_duplicates("url", keep="last")
+    frame["rating"] = rowScores(frame)
+    frame = frame.dropna(subset=["rating"])
+    joined = joinPosts(frame)
+    pending = frame[~frame["url"].isin(joined["url"])]
+    bucket = pd.to_datetime(joined["ts"], utc=True, format="ISO8601", errors="coerce").dt.floor(BUCKET)
+    joined = joined[bucket.notna()]; bucket = bucket[bucket.notna()]
+
+    contributions = summands(joined)
+    codes, keys = pd.factorize(bucket)
+    contributions.insert(0, "url", joined["url"]); contributions.insert(1, "bucket", keys.strftime("%Y-%m-%dT%H:%M:%S")[codes]) #Format the few bucket keys, not every row
+    contributions.insert(2, "user", joined["user"])
+    with conn:
+        applyContributions(loadContributions(contributions["url"]), -1) #Earlier scores of these URLs
+        applyContributions(contributions, 1)
+        conn.executemany("INSERT OR REPLACE INTO contributions VALUES (" + ",".join("?"*(len(SUM_COLUMNS)+3)) + ")", contributions.itertuples(index=False, name=None))
+        conn.execute("DELETE FROM buckets WHERE n <= 0"); conn.execute("DELETE FROM users WHERE n <= 0")
+        conn.execute("DELETE FROM pending")
+        pending = pending[["url", "response", "score", "parsed"]].astype(object)
+        conn.executemany("INSERT INTO pending VALUES (?,?,?,?)", pending.where(pending.notna(), None).itertuples(index=False, name=None))
+        conn.execute("INSERT OR REPLACE INTO progress VALUES (?,?)", (fileName, offset))
+    print("Aggregates: added", len(contributions), "scored posts from", fileName + ("" if pending.empty else " | " + str(len(pending)) + " waiting for their post in the store"))
+    return len(contributions)
+
+#Drops the running sums and re-reads the whole eval .csv (e.g. after karma/comments were refreshed)
+def rebuild(fileName=evalFileName):
+    conn = getConnection()
+    with conn:
+        for table in ("buckets", "users", "contributions", "pending", "progress"): conn.execute("DELETE FROM " + table)
+    return update(fileName)
+
+"""
+=========================================================
+                        QUERIES
+=========================================================
+"""
+
+#Returns the sums table as a frame indexed by its key
+def loadSums(table, key):
+    frame = pd.read_sql_query("SELECT * FROM " + table, getConnection(), index_col=key)
+    return frame.astype(float)
+
+#Metrics over every scored post
+def overall():
+    return metrics(loadSums("buckets", "bucket").sum().to_frame().T).iloc[0]
+
+#Metrics per bucket over a trailing rolling window (e.g. "24h", "7D"), indexed by bucket start (UTC)
+def timeSeries(window="24h"):
+    sums = loadSums("buckets", "bucket")
+    if sums.empty: return metrics(sums)
+    sums.index = pd.to_datetime(sums.index, utc=True)
+    sums = sums.sort_index().asfreq(BUCKET, fill_value=0.0) #Regular grid so the window is a fixed span
+    return metrics(sums.rolling(window).sum())
+
+#Metrics per user with at least minPosts scored posts, most prolific first
+def userAggregates(minPosts=1):
+    sums = loadSums("users", "user")
+    return metrics(sums[sums["n"] >= minPosts]).sort_values("count", ascending=False)
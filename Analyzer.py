@@ -1,15 +1,21 @@
-from openai import OpenAI
-import nltk
-import nltk
-import ssl
-import json, ujson, csv
+import ujson, csv
 from pathlib import Path
 import time
 import math
-client = OpenAI(api_key = "do not steal my key")
+import numpy as np
+import Planner
+import Ledger
+import PromptCache
+import Dedup
+import Relevance
+import Responses
+import Store
+import Metrics
+from concurrent.futures import ThreadPoolExecutor
 
 #Download NLTK Punkt package (comment out if done)
 """
+import ssl, nltk
 try:
     _create_unverified_https_context = ssl._create_unverified_context
 except AttributeError:
@@ -27,6 +33,16 @@ to deduce factors like partisanship or general trends.
 @version 7/27/2024
 """
 
+client = None #OpenAI client, created on first use (openai is slow to import); assign a stand-in here to redirect every call
+
+#Returns the OpenAI client, importing openai and creating it on first use
+def getClient():
+   global client
+   if client is None:
+      from openai import OpenAI
+      client = OpenAI(api_key = "do not steal my key")
+   return client
+
 #Batch in/out filenames
 batchBWInFileName = "requests_in/batch_bw_in.jsonl" #Black-white analysis batch IN file
 batchEvalInFileName = "requests_in/batch_eval_in.jsonl" #Evaluation batch IN file
@@ -34,7 +50,7 @@ batchEvalInFileName = "requests_in/batch_eval_in.jsonl" #Evaluation batch IN fil
 batchBWOutFileName = "requests_out/batch_bw_out.jsonl" #Black-white analysis batch OUT file
 batchEvalOutFileName = "requests_out/batch_eval_out.jsonl" #Evaluation batch OUT file
 
-#Result filenames
+#Result filenames (of Responses.RESULTS_STOCK, see Responses.resultsFileName for other stocks)
 BWFileName = "results/post_bw.csv" #Black-white analysis for all posts
 EvalFileName = "results/post_eval.csv" #Full evaluation for all posts
 
@@ -49,6 +65,16 @@ MAX_BATCH_TOKENS_BW = 200000 #Max tokens can send per batch for BW
 MAX_BATCH_TOKENS_CAT = 20000000-50000 #20000000 Max tokens can send per batch for categorical
 MAX_BATCH_TOKENS_EVAL = 90000 #Max tokens can send per batch for eval
 
+DEDUP_NEAR_DUPLICATES = True #Classify one post per near-duplicate cluster and copy its result to the rest (see Dedup.py)
+LOCAL_PREFILTER_BW = True #Decide obviously related/unrelated posts locally, only send the ambiguous ones for BW (see Relevance.py)
+
+PACKED_REQUESTS = False #Send several posts per request answered as one JSON list (shares the preamble), unanswered posts fall back to single requests
+PACK_MAX_INPUT_TOKENS = 4000 #Input token budget of one packed request
+PACK_MAX_POSTS = 25 #Max posts per packed request
+PACK_OUT_TOKENS_PER_POST = 20 #Reply budget per post, e.g. {"id":12,"related":"Y","score":-35},
+
+INGEST_CHUNK = 200 #Result rows written to the .csv between ledger checkpoints (the most a crash mid-retrieval can write twice)
+
 """
 =========================================================
                ARTICLE PREPROCESSING / MISC
@@ -91,6 +117,27 @@ def generatePrompts_Eval(title, description, stock):
                + title + "' and DESCRIPTION: '" + description + "' Try not 0.0, specific and precise, one sig. fig. Format: number | 1-word justification"})
    return prompts
 
+#Generates the prompt table for a packed request: several posts, asked for one {id, related, score} object each
+#Posts are numbered by position in the pack, which is how answers are mapped back (see Ledger.packMembers)
+def generatePrompts_Packed(posts, stock):
+   prompts = [{"role":"system", "content":"You are an intelligent stock market analyst."}]
+
+   prompts.append({"role":"user", "content":"For each Reddit post below, answer if it is related to " + stock + "'s stock or market behavior (Y or N) and assign "
+                   + "an optimism score on scale of -100 (negative) to 100 (positive) surrounding " + stock + " stock (0 if not related). Try not 0.0, specific and precise, one sig. fig. "
+                   + "Answer with one object per post: {\"id\": post number, \"related\": \"Y\" or \"N\", \"score\": number}\n"
+                   + "".join(packLine(i, title, description) for i, (title, description) in enumerate(posts))})
+   return prompts
+
+#One post of a packed prompt, whitespace collapsed and description trimmed to TEXT_MAX_CUTOFF
+def packLine(i, title, description):
+   return "\n[" + str(i) + "] TITLE: '" + " ".join(title.split()) + "' DESCRIPTION: '" + " ".join(description[:TEXT_MAX_CUTOFF].split()) + "'"
+
+#Structured output schema of packed answers, so the model can only reply with parseable JSON
+PACKED_RESPONSE_FORMAT = {"type": "json_schema", "json_schema": {"name": "post_answers", "strict": True, "schema": {
+   "type": "object", "additionalProperties": False, "required": ["posts"], "properties": {"posts": {"type": "array", "items": {
+      "type": "object", "additionalProperties": False, "required": ["id", "related", "score"], "properties": {
+         "id": {"type": "integer"}, "related": {"type": "string", "enum": ["Y", "N"]}, "score": {"type": "number"}}}}}}}}
+
 """
 =========================================================
                         AI ANALYSIS
@@ -98,50 +145,126 @@ def generatePrompts_Eval(title, description, stock):
 """
 
 #Finalizes and sends a batch request to ChatGPT API given requests file
-def finalizeBatch(reqsFileName, desc, confirmMsg):
+#batchPlan (a Planner.planBatches entry) is kept in the batch's metadata to compare with the billed usage at retrieval,
+#and so is csvFileName, the results .csv the batch is ingested into (resumed batches go back to their own stock's file)
+def finalizeBatch(reqsFileName, desc, confirmMsg, batchPlan=None, csvFileName=None):
    #Send to Batch API
    confirmMsg = input("Double check "+reqsFileName+" for correct info: (1) Confirm, (2) Cancel\n") if confirmMsg else "1"
    if confirmMsg == "1":
-      batch_input_file = client.files.create(
+      batch_input_file = getClient().files.create(
          file=open(reqsFileName, "rb"),
          purpose="batch"
       )
       file_id = batch_input_file.id
 
-      batch = client.batches.create(
+      metadata = {"description" : desc, "inputFile" : reqsFileName} #inputFile lets a restarted run find this batch
+      if batchPlan: metadata.update(plannedTokens=str(batchPlan["tokens"]), plannedCost="%.6f" % batchPlan["cost"])
+      if csvFileName: metadata["resultsFile"] = csvFileName
+      batch = getClient().batches.create(
          input_file_id=file_id,
          endpoint="/v1/chat/completions",
          completion_window="24h",
-         metadata={"description" : desc}
+         metadata=metadata
       )
       print("Successfully created batch, batch id:",batch.id)
       return batch
    return None
 
 #Retrieves the output/results file of a specific batch and writes article info and response to json and csv files
-def retrieveBatchResult(batch, jsonFileName, csvFileName):
-   if batch.status == "completed":
-      batchResult = client.files.content(batch.output_file_id).content
-      with open(jsonFileName, "wb") as f: #Write to raw .jsonl file
-         f.write(batchResult)
-
-      results = []
-      with open(jsonFileName, "r") as f: #Read results from raw .jsonl file
-         for line in f:
-            json_obj = json.loads(line.strip())
-            results.append(json_obj)
-      
-      postCount = 0
-      with open(csvFileName, "a") as csvF: #Append article info and responses to .csv file
+#Streams the output in one pass (raw .jsonl and .csv rows written line by line), so memory stays flat for any batch size
+#The .csv rows get the typed columns of kind ("bw"/"eval", see Responses.py) next to the raw answer
+#Billed tokens and cost (from each line's usage) are recorded in Metrics next to the batch's planned ones
+#Written requests are checkpointed in the ledger every INGEST_CHUNK rows, and requests the ledger already has as parsed
+#are skipped, so retrieving a batch again after a crash doesn't append its rows twice
+#Returns the custom ids that were written to the .csv (now or by an earlier, interrupted retrieval)
+def retrieveBatchResult(batch, jsonFileName, csvFileName, kind=None):
+   if batch.output_file_id: #Completed (or expired with partial results)
+      written = Ledger.parsedIds(batch.id)
+      parsedIds = []; chunkIds = []; cacheRows = []; errorCount = 0; rowCount = 0; skipCount = 0
+      inTokens = 0; outTokens = 0; cost = 0.0
+      with getClient().files.with_streaming_response.content(batch.output_file_id) as stream, \
+           open(jsonFileName, "w") as jsonF, Responses.appendResults(csvFileName) as csvF:
          csvWriter = csv.writer(csvF)
-         for res in results:
-            postInfo = res["custom_id"].split("|") #Post URL
-            response = res["response"]["body"]["choices"][0]["message"]["content"]
-            csvWriter.writerow([postInfo[0], response])
-            postCount+=1
-      print(batch.id, "successfully processed:",postCount,"posts")
+         for line in stream.iter_lines():
+            if not line.strip(): continue
+            jsonF.write(line + "\n") #Raw .jsonl copy
+
+            result = parseResultLine(line)
+            if result is None: errorCount += 1; continue
+            customId, response, usage, model = result
+            inTokens += usage[0]; outTokens += usage[1]; cost += Planner.predictCost(model, *usage)
+            if customId in written: parsedIds.append(customId); skipCount += 1; continue #Written before a crash
+            postInfo = customId.split("|") #Post URL
+            if postInfo[0] == "pack": #One answer per post of a packed request, each cached as its single request's answer
+               answers = list(unpackAnswers(kind, customId, response))
+               for url, promptHash, answer in answers:
+                  csvWriter.writerow(Responses.resultRow(kind, url, answer)); cacheRows.append((promptHash, answer))
+               if answers: chunkIds.append(customId)
+               rowCount += len(answers)
+            else:
+               csvWriter.writerow(Responses.resultRow(kind, postInfo[0], response)) #Append article info and responses to .csv file
+               chunkIds.append(customId); rowCount += 1
+               if len(postInfo) == 2: cacheRows.append((postInfo[1], response)) #url|prompt hash
+            if len(chunkIds) >= INGEST_CHUNK:
+               checkpointRows(batch.id, csvF, chunkIds, cacheRows); parsedIds += chunkIds; chunkIds = []; cacheRows = []
+         checkpointRows(batch.id, csvF, chunkIds, cacheRows); parsedIds += chunkIds
+      print(batch.id, "successfully processed:",rowCount,"posts" + (" | errors: " + str(errorCount) if errorCount else "") + (" | already written: " + str(skipCount) if skipCount else ""))
+      recordBatchUsage(batch, kind, inTokens, outTokens, cost)
+      return parsedIds
    else:
       print(batch.id, "|", batch.status)
+      return []
+
+#Flushes the .csv rows written so far, then records them as parsed and caches their answers
+def checkpointRows(batchId, csvF, customIds, cacheRows):
+   if not customIds: return
+   csvF.flush()
+   PromptCache.putMany(cacheRows)
+   Ledger.markParsed(batchId, customIds)
+
+#Splits a packed answer into (url, prompt hash, answer) per post, answers in the single-request format of kind
+#("Y"/"N" for BW, the score for eval); posts the answer skipped or garbled are left out (sent again as single requests)
+def unpackAnswers(kind, customId, response):
+   answers = Responses.parsePacked(response)
+   for i, (url, promptHash) in enumerate(Ledger.packMembers(kind, customId)):
+      related, score = answers.get(i, ("", None))
+      if kind == "eval" and score is not None: yield url, promptHash, "%g" % score
+      elif kind != "eval" and related: yield url, promptHash, related
+
+#Records a retrieved batch's billed tokens/cost and its queueing/run time in Metrics, prints them against the plan
+def recordBatchUsage(batch, kind, inTokens, outTokens, cost):
+   kind = kind or "other"
+   metadata = batch.metadata or {}
+   Metrics.inc("batches", kind=kind); Metrics.inc("tokens_in", inTokens, kind=kind); Metrics.inc("tokens_out", outTokens, kind=kind); Metrics.inc("cost_usd", cost, kind=kind)
+   created, started, completed = (getattr(batch, name, None) for name in ("created_at", "in_progress_at", "completed_at"))
+   if created and started: Metrics.observe("batch_queue_s", started - created, kind=kind) #Validation + waiting for capacity
+   if started and completed: Metrics.observe("batch_run_s", completed - started, kind=kind)
+   planned = ""
+   if "plannedTokens" in metadata: #Planned figures travel with the batch, so resumed batches compare too
+      Metrics.inc("tokens_planned", int(metadata["plannedTokens"]), kind=kind); Metrics.inc("cost_planned_usd", float(metadata["plannedCost"]), kind=kind)
+      planned = " (planned " + metadata["plannedTokens"] + " in, $" + metadata["plannedCost"] + ")"
+   print(batch.id, "| billed tokens in:", inTokens, "out:", outTokens, "| cost: $" + str(round(cost, 4)) + planned)
+
+#Reads one batch output line, returns (custom id, response content, (prompt tokens, completion tokens), model)
+#or None for error records (broken JSON, non-200 status_code, error object, missing choices/content)
+def parseResultLine(line):
+   try:
+      res = ujson.loads(line)
+   except ValueError:
+      return None
+   if not isinstance(res, dict) or res.get("error") or "custom_id" not in res: return None
+   response = res.get("response")
+   if not isinstance(response, dict) or response.get("status_code") != 200: return None
+   body = response.get("body")
+   if not isinstance(body, dict): return None
+   choices = body.get("choices")
+   if not isinstance(choices, list) or not choices or not isinstance(choices[0], dict): return None
+   message = choices[0].get("message")
+   if not isinstance(message, dict): return None
+   content = message.get("content")
+   if not isinstance(content, str): return None
+   usage = body.get("usage") or {}
+   return res["custom_id"], content, (usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0), body.get("model") or ""
 
 #Analyzes a Reddit post given its title and description
 #Deduces if the article is related to the target stock, and if so, how optimistic it is to the target stock and to what degree
@@ -150,19 +273,13 @@ def retrieveBatchResult(batch, jsonFileName, csvFileName):
 #!!*For cost and efficiency, this method is deprecated: send bulk articles via GPT batch API system
 
 def stockAnalyze(headline, bodyText):
-   chat_comp = client.chat.completions.create(model="gpt-3.5-turbo-0125", messages=generatePrompts_BW(headline, bodyText))
+   chat_comp = getClient().chat.completions.create(model="gpt-3.5-turbo-0125", messages=generatePrompts_BW(headline, bodyText))
    isPolitical = chat_comp.choices[0].message.content
 
    if "y" in isPolitical.lower():
-      chat_comp = client.chat.completions.create(model="gpt-4o-2024-05-13", messages=generatePrompts_Eval(headline, bodyText), temperature=0.6, top_p=0.5)
-      rating = chat_comp.choices[0].message.content.split(" | ")
-
-      #Try to convert to number
-      if len(rating) < 2: return 0.0, "Not related"
-      try:
-         return float(rating[0]), rating[1]
-      except ValueError:
-         return 0.0, "Error"
+      chat_comp = getClient().chat.completions.create(model="gpt-4o-2024-05-13", messages=generatePrompts_Eval(headline, bodyText), temperature=0.6, top_p=0.5)
+      score, justification, parsed = Responses.parseEval(chat_comp.choices[0].message.content)
+      return (score, justification) if parsed else (0.0, "Error")
    else:
       return 0.0, "Not related"
    
@@ -172,115 +289,222 @@ def stockAnalyze(headline, bodyText):
 =========================================================
 """
 
+#Formats one chat completion request line for the batch .jsonl, custom_id is "url|prompt hash" ("pack|prompt hash" for packed requests)
+def formatRequest(url, prompts, maxTokens=8, responseFormat=None):
+   body = {
+      "model" : "gpt-4.1-nano",
+      "messages" :  prompts,
+      "max_tokens" : maxTokens
+   }
+   if responseFormat: body["response_format"] = responseFormat
+   return { 
+      "custom_id" : url + "|" + PromptCache.promptHash(body),
+      "method" : "POST",
+      "url" : "/v1/chat/completions", 
+      "body" : body
+   }
+
+#Splits formatted requests into cache hits and requests still to send
+#Hits for posts missing from the results .csv are appended to it; requests already in flight are dropped
+#Posts answered before the cache existed (results .csv rows without a hash) count as hits while their content is unchanged,
+#see PromptCache.seedLegacy; takes in {url -> (title, description)} for the posts of the requests
+def filterCachedRequests(dataList, kind, csvFileName, postsByUrl):
+   cached = PromptCache.getMany(data["custom_id"].split("|")[-1] for data in dataList)
+   taken = Ledger.takenIds(kind)
+   known = Responses.loadResults(csvFileName)
+   if not PromptCache.isSeeded(csvFileName):
+      PromptCache.seedLegacy(csvFileName, known, legacyContentHashes(known, postsByUrl))
+   uncached = [data["custom_id"].split("|") for data in dataList if data["custom_id"].split("|")[-1] not in cached]
+   cached.update(PromptCache.adoptLegacy(csvFileName, [(url, h, PromptCache.contentHash(*postsByUrl[url])) for url, h in uncached]))
+
+   toSend = []; merged = set()
+   with Responses.appendResults(csvFileName) as csvF:
+      csvWriter = csv.writer(csvF)
+      for data in dataList:
+         url, promptHash = data["custom_id"].split("|")
+         if promptHash in cached:
+            if url not in known and url not in merged:
+               csvWriter.writerow(Responses.resultRow(kind, url, cached[promptHash])); merged.add(url)
+         elif data["custom_id"] not in taken:
+            toSend.append(data)
+   print("Prompt cache:", len(dataList)-len(toSend), "of", len(dataList), "requests answered or in flight |", len(merged), "cached results merged into", csvFileName)
+   return toSend
+
+#Content hashes of the posts answered in a results .csv, from the posts at hand or else the post store
+#Locally decided rows (Relevance.LOCAL_TAG) were never model answers and are left out
+#Takes in {url -> [response, typed columns...]} and {url -> (title, description)}, returns {url -> content hash}
+def legacyContentHashes(known, postsByUrl):
+   urls = [url for url, row in known.items() if not row[0].endswith(Relevance.LOCAL_TAG)]
+   posts = Store.getPosts([url for url in urls if url not in postsByUrl], ("title", "description")) if Path(Store.storeFileName).exists() else {}
+   posts.update((url, postsByUrl[url]) for url in urls if url in postsByUrl)
+   return {url: PromptCache.contentHash(*post) for url, post in posts.items()}
+
+#Packs single-post requests, in order, into as few packed requests as fit PACK_MAX_INPUT_TOKENS/PACK_MAX_POSTS
+#and records each pack's posts in the ledger; returns the requests to send (packs of one stay single requests)
+#Takes in {url -> (title, description)} for the posts of the requests
+def packRequests(kind, dataList, postsByUrl, stock):
+   model = formatRequest("pack", [])["body"]["model"]
+   preamble = Planner.requestTokens(formatRequest("pack", generatePrompts_Packed([], stock))["body"])
+   packs = []; current = []; tokens = preamble
+   for data in dataList:
+      title, description = postsByUrl[data["custom_id"].split("|")[0]]
+      lineTokens = Planner.countTokens(packLine(len(current), title, description), model)
+      if current and (tokens + lineTokens > PACK_MAX_INPUT_TOKENS or len(current) >= PACK_MAX_POSTS):
+         packs.append(current); current = []; tokens = preamble
+      current.append(data); tokens += lineTokens
+   if current: packs.append(current)
+
+   toSend = []; members = {}
+   for pack in packs:
+      if len(pack) == 1: toSend.append(pack[0]); continue
+      urls = [data["custom_id"].split("|")[0] for data in pack]
+      packed = formatRequest("pack", generatePrompts_Packed([postsByUrl[url] for url in urls], stock), PACK_OUT_TOKENS_PER_POST*len(pack) + 16, PACKED_RESPONSE_FORMAT)
+      members[packed["custom_id"]] = [tuple(data["custom_id"].split("|")) for data in pack]
+      toSend.append(packed)
+   Ledger.planPacks(kind, members)
+   print("Packed", len(dataList), "posts into", len(toSend), "requests | input tokens:", sum(Planner.requestTokens(d["body"]) for d in dataList), "->", sum(Planner.requestTokens(d["body"]) for d in toSend))
+   return toSend
+
+#Plans, submits and polls the requests of a kind; in packed mode they go out packed first, then posts the packed
+#answers didn't cover are sent again as single-post requests
+def sendRequests(kind, dataList, postsByUrl, stock, maxTokens, label, inFileName, outFileName, logFileName, csvFileName, startIndex, desc, confirmMsg, packed=None):
+   if packed is None: packed = PACKED_REQUESTS
+   toSend = packRequests(kind, dataList, postsByUrl, stock) if packed else dataList
+   plan = Planner.planBatches(toSend, maxTokens)
+   Planner.printPlan(plan, label)
+
+   #Submit every batch at once, then ingest each as it completes
+   submitted = submitBatches(kind, toSend, plan, inFileName, outFileName, logFileName, csvFileName, startIndex, desc, confirmMsg)
+   pollBatches(submitted, csvFileName, kind)
+   if packed and submitted:
+      retry = filterCachedRequests(dataList, kind, csvFileName, postsByUrl)
+      if retry:
+         print("Packed answers missed", len(retry), "posts, sending them as single-post requests")
+         sendRequests(kind, retry, postsByUrl, stock, maxTokens, label, inFileName, outFileName, logFileName, csvFileName, startIndex, desc, confirmMsg, False)
+
 #Writes article information to .json and sends batch request to GPT-3.5 for black white analysis (is/is not related)
 #Takes in table in the format [(url, title, description, ts, karma, comments, user),...]
 def createBatch_BWAnalysis(allPosts, stock, startIndex=0, confirmMsg=True):
-   #Send in multiple batches to not exceed limit
-   index = startIndex
-   while (index < len(allPosts)):
-      totalCharacters = 0
-      previousIndex = index
-      dataList = []
-      #Create data table
-      for i in range(index, len(allPosts)):
-         url, title, description, ts, karma, comments, user = allPosts[i]
-         prompts = generatePrompts_BW(title, description, stock) #Generate prompts
-
-         for p in prompts: totalCharacters += len(p["content"])
-         if totalCharacters > MAX_BATCH_TOKENS_BW*3.5: #If over limit, stop and send batch
-            for p in prompts: totalCharacters -= len(p["content"])
-            break
-         index = i
-
-         #Format request
-         data = { 
-            "custom_id" : url,
-            "method" : "POST",
-            "url" : "/v1/chat/completions", 
-            "body" : {
-               "model" : "gpt-4.1-nano",
-               "messages" :  prompts,
-               "max_tokens" : 8
-            }
-         }
-         dataList.append(data)
-      index+=1 #Advance to next start point
-
-      #Write to .jsonl
-      write_jsonl(batchBWInFileName, dataList)
-
-      #Echo results
-      print("Wrote",len(dataList),"articles ["+str(previousIndex),"-",str(index-1)+"] to",batchBWInFileName)
-      print("Total characters:",totalCharacters,"| Average characters per article:",(totalCharacters/len(dataList)))
-      print("Tokens used:",(totalCharacters/4),"| Predicted cost: ",(totalCharacters/4*0.1/1e6),"| GPT-4.1-nano")
-      with open(logBWFileName, "a") as csvF: #Log end index to file
-         csvWriter = csv.writer(csvF)
-         csvWriter.writerow(["Last ended index: " + str(index)])
-
-      #Create batch and wait for completion
-      batch = finalizeBatch(batchBWInFileName, "Black-white analysis of articles", confirmMsg)
-      if batch == None: return #Cancelled
-
-      while (batch.status not in ["completed","failed","cancelled"]):
-         time.sleep(3)
-         batch = client.batches.retrieve(batch.id)
-
-      retrieveBatchResult(batch, batchBWOutFileName, BWFileName)
+   bwFileName = Responses.resultsFileName(BWFileName, stock)
+   #Pick up batches a previous run left in flight
+   resumeBatches("bw", bwFileName)
+
+   #Send one post per near-duplicate cluster
+   posts = allPosts[startIndex:]; clusterOf = {}
+   if DEDUP_NEAR_DUPLICATES: posts, clusterOf = Dedup.dedupePosts(posts)
+   if LOCAL_PREFILTER_BW: posts = Relevance.prefilter(posts, stock, bwFileName)
+
+   #Format every request, then plan batches under the limits up front
+   dataList = []
+   for url, title, description, ts, karma, comments, user in posts:
+      dataList.append(formatRequest(url, generatePrompts_BW(title, description, stock)))
+   postsByUrl = {post[0]: (post[1], post[2]) for post in posts}
+   dataList = filterCachedRequests(dataList, "bw", bwFileName, postsByUrl) #Only cache misses get sent
+   if dataList:
+      sendRequests("bw", dataList, postsByUrl, stock, MAX_BATCH_TOKENS_BW, "BW analysis", batchBWInFileName, batchBWOutFileName, logBWFileName,
+                   bwFileName, startIndex, "Black-white analysis of articles", confirmMsg)
+   else:
+      print("No new posts to send")
+   Dedup.fanOutResults(bwFileName, clusterOf) #Copy representatives' results to their duplicates
 
 #Writes article information .json and sends batch request to GPT-4.1-nano for optimism score evaluation
 #Takes in table in the format [(url, title, description, ts, karma, comments, user),...]
 def createBatch_Eval(allPosts, stock, startIndex=0, confirmMsg=True):
-   #Send in multiple batches to not exceed limit
-   index = startIndex
-   while (index < len(allPosts)):
-      totalCharacters = 0
-      previousIndex = index
-      dataList = []
-      #Create data table
-      for i in range(index, len(allPosts)):
-         url, title, description, ts, karma, comments, user = allPosts[i]
-         prompts = generatePrompts_Eval(title, description, stock) #Generate prompts
-
-         for p in prompts: totalCharacters += len(p["content"])
-         if totalCharacters > MAX_BATCH_TOKENS_EVAL*3.5: #If over limit, stop and send batch
-            for p in prompts: totalCharacters -= len(p["content"])
-            break
-         index = i
-         
-         #Format request
-         data = { 
-            "custom_id" : url,
-            "method" : "POST",
-            "url" : "/v1/chat/completions", 
-            "body" : {
-               "model" : "gpt-4.1-nano",
-               "messages" :  prompts,
-               "max_tokens" : 8
-            }
-         }
-         dataList.append(data)
-      index+=1 #Advance to next start point
-
-      #Write to .jsonl
-      write_jsonl(batchEvalInFileName, dataList)
-
-      #Echo results
-      print("Wrote",len(dataList),"articles ["+str(previousIndex),"-",str(index-1)+"] to",batchEvalInFileName)
-      print("Total characters:",totalCharacters,"| Average characters per article:",(totalCharacters/len(dataList)))
-      print("Tokens used:",(totalCharacters/4),"| Predicted cost: ",(totalCharacters/4*0.1/1e6),"| GPT-4.1-nano")
-      with open(logEvalFileName, "a") as csvF: #Log end index to file
+   evalFileName = Responses.resultsFileName(EvalFileName, stock)
+   #Pick up batches a previous run left in flight
+   resumeBatches("eval", evalFileName)
+
+   #Send one post per near-duplicate cluster
+   posts = allPosts[startIndex:]; clusterOf = {}
+   if DEDUP_NEAR_DUPLICATES: posts, clusterOf = Dedup.dedupePosts(posts)
+
+   #Format every request, then plan batches under the limits up front
+   dataList = []
+   for url, title, description, ts, karma, comments, user in posts:
+      dataList.append(formatRequest(url, generatePrompts_Eval(title, description, stock)))
+   postsByUrl = {post[0]: (post[1], post[2]) for post in posts}
+   dataList = filterCachedRequests(dataList, "eval", evalFileName, postsByUrl) #Only cache misses get sent
+   if dataList:
+      sendRequests("eval", dataList, postsByUrl, stock, MAX_BATCH_TOKENS_EVAL, "evaluation", batchEvalInFileName, batchEvalOutFileName, logEvalFileName,
+                   evalFileName, startIndex, "Political evaluation of articles", confirmMsg)
+   else:
+      print("No new posts to send")
+   Dedup.fanOutResults(evalFileName, clusterOf) #Copy representatives' results to their duplicates
+
+#Makes a per-batch file name from a base name, e.g. requests_in/batch_bw_in.jsonl -> requests_in/batch_bw_in_20241217_201917_0.jsonl
+def uniqueFileName(baseFileName, runId, n):
+   return baseFileName.replace(".jsonl", "_" + runId + "_" + str(n) + ".jsonl")
+
+#Writes every planned batch to its own .jsonl and submits them all up front
+#Returns [(batch, output .jsonl file name),...], empty if cancelled
+def submitBatches(kind, dataList, plan, inFileName, outFileName, logFileName, csvFileName, startIndex, desc, confirmMsg):
+   runId = time.strftime("%Y%m%d_%H%M%S")
+   while Path(uniqueFileName(inFileName, runId, 0)).exists(): runId += "b" #Second round within the same second
+   inFileNames = []
+   for n, batchPlan in enumerate(plan):
+      inFileNames.append(uniqueFileName(inFileName, runId, n))
+      batchData = dataList[batchPlan["start"]:batchPlan["end"]]
+      write_jsonl(inFileNames[-1], batchData)
+      Ledger.planFile(kind, inFileNames[-1], uniqueFileName(outFileName, runId, n), [data["custom_id"] for data in batchData])
+      print("Wrote",batchPlan["requests"],"articles ["+str(startIndex+batchPlan["start"]),"-",str(startIndex+batchPlan["end"]-1)+"] to",inFileNames[-1])
+
+   confirmMsg = input("Double check "+uniqueFileName(inFileName, runId, "*")+" ("+str(len(plan))+" files) for correct info: (1) Confirm, (2) Cancel\n") if confirmMsg else "1"
+   if confirmMsg != "1": #Cancelled
+      for inFile in inFileNames: Ledger.abandonFile(inFile)
+      return []
+
+   submitted = []
+   for n, batchPlan in enumerate(plan):
+      batch = finalizeBatch(inFileNames[n], desc, False, batchPlan, csvFileName)
+      Ledger.submitFile(inFileNames[n], batch.id)
+      submitted.append((batch, uniqueFileName(outFileName, runId, n)))
+      with open(logFileName, "a") as csvF: #Log end index to file
          csvWriter = csv.writer(csvF)
-         csvWriter.writerow(["Last ended index: " + str(index)])
-
-      #Create batch and wait for completion
-      batch = finalizeBatch(batchEvalInFileName, "Political evaluation of articles", confirmMsg)
-      if batch == None: return #Cancelled
-
-      while (batch.status not in ["completed","failed","cancelled"]):
-         time.sleep(3)
-         batch = client.batches.retrieve(batch.id)
-
-      retrieveBatchResult(batch, batchEvalOutFileName, EvalFileName)
+         csvWriter.writerow(["Last ended index: " + str(startIndex+batchPlan["end"])])
+   return submitted
+
+#Finishes batches a previous (crashed) run submitted: re-attaches planned files that did become batches,
+#releases the ones that didn't, then polls and ingests everything still in flight
+def resumeBatches(kind, csvFileName):
+   planned = Ledger.plannedFiles(kind)
+   if planned:
+      for batch in getClient().batches.list(limit=100):
+         inFile = (batch.metadata or {}).get("inputFile")
+         if inFile in planned:
+            Ledger.submitFile(inFile, batch.id)
+            del planned[inFile]
+            if not planned: break
+      for inFile in planned: Ledger.abandonFile(inFile)
+
+   inFlight = Ledger.inFlightBatches(kind)
+   if inFlight:
+      print("Resuming", len(inFlight), kind, "batches from the ledger")
+      pollBatches([(getClient().batches.retrieve(batchId), outFileName) for batchId, outFileName in inFlight], csvFileName, kind)
+
+POLL_MIN_INTERVAL = 3 #Seconds between polls right after a status change
+POLL_MAX_INTERVAL = 60 #Polling slows down to this while nothing changes
+POLL_BACKOFF = 1.5
+
+#Polls submitted batches concurrently with adaptive backoff and ingests each one as soon as it finishes
+def pollBatches(submitted, csvFileName, kind=None):
+   pending = {batch.id: (batch, outFileName) for batch, outFileName in submitted}
+   interval = POLL_MIN_INTERVAL
+   with ThreadPoolExecutor(max_workers=max(1, min(8, len(pending)))) as pool:
+      while pending:
+         time.sleep(interval)
+         changed = False
+         for batch in pool.map(getClient().batches.retrieve, list(pending.keys())):
+            previous, outFileName = pending[batch.id]
+            if batch.status != previous.status: changed = True
+            if batch.status in ["completed","failed","cancelled","expired"]:
+               if batch.status == "completed": Ledger.completeBatch(batch.id)
+               resultsFile = (batch.metadata or {}).get("resultsFile", csvFileName) #Batches from before per-stock results have none
+               Ledger.finishBatch(batch.id, batch.status, retrieveBatchResult(batch, outFileName, resultsFile, kind))
+               del pending[batch.id]
+            else:
+               pending[batch.id] = (batch, outFileName)
+         interval = POLL_MIN_INTERVAL if changed else min(interval*POLL_BACKOFF, POLL_MAX_INTERVAL)
+         if pending: print("Pending batches:", len(pending), "| next poll in", round(interval, 1), "s")
 
 """
 =========================================================
@@ -289,35 +513,27 @@ def createBatch_Eval(allPosts, stock, startIndex=0, confirmMsg=True):
 """
 
 #Calculates the overall political rating of a specific publication by taking the mean square of all article ratings
-#Since squaring removes negatives, add it back by calculating in two parts: sqrt([ Σ(-[neg.]^2) + Σ([pos.]^2) ] / (n-1))
+#Since squaring removes negatives, add it back by calculating in two parts: sqrt([ Σ(-[neg.]^2) + Σ([pos.]^2) ] / n)
+#(Aggregate.py computes the same over time windows, karma/comment weights and users)
 def calculatePublicationPolitics(ratings):
-   neg_sum = 0.0; pos_sum = 0.0
-   for x in ratings:
-      if x < 0:
-         neg_sum += x**2
-      else:
-         pos_sum += x**2
-   
-   sum = ((pos_sum - neg_sum) / len(ratings))
+   x = np.asarray(ratings, dtype=float)
+   sum = float(np.dot(np.sign(x)*x, x)) / len(ratings)
    if sum == 0: return 0 #Avoid divide by zero
    #Get the square root (avoid negative with sqrt(abs(S)) * (S/|S|)
    return math.sqrt(abs(sum)) * sum/abs(sum)
 
 #Calculates the overall political rating of a city by taking the simple (arithmetic) mean
 def calculateCityPolitics(ratings):
-   sum = 0.0
-   for x in ratings:
-      sum += x
-   return sum / len(ratings)
+   return float(np.sum(np.asarray(ratings, dtype=float))) / len(ratings)
 
 
 #Driver code for retrieving specific batch
 """
 batchId = "batch_J5nE9rLKmiMEHMOKvakjFiU5"
-batch = client.batches.retrieve(batchId)
+batch = getClient().batches.retrieve(batchId)
 while (batch.status not in ["completed","failed","cancelled"]):
    time.sleep(3)
-   batch = client.batches.retrieve(batch.id)
+   batch = getClient().batches.retrieve(batch.id)
    print("Pending...")
-retrieveBatchResult(batch, batchBWOutFileName, BWFileName)
+retrieveBatchResult(batch, batchBWOutFileName, BWFileName, "bw")
 """
\ No newline at end of file
@@ -0,0 +1,457 @@
+"""
+Offline benchmarks for WallScrape hot paths. Everything runs against the fixtures saved in the repo
+(debug.txt post page, data/ posts, requests_out/ batch results), scaled up with synthetic copies
+(10x-1000x by default), no network needed: the Batch API is FakeBatchAPI's in-process client, and
+anything that writes results/ledgers runs in a throwaway directory.
+
+Each benchmark checks its output before timing it. Best times are appended to the history file
+with the commit they ran on, and anything slower than the last run on the same machine by more
+than REGRESSION_THRESHOLD is flagged (exit status 1).
+
+Run with: python Benchmark.py [--only startup search jsonl ...] [--scales 10 100 1000] [--corpus data/http_cache.sqlite] [--no-history]
+
+@author Victor Gong
+@version 10/18/2026
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import csv
+import random
+import sqlite3
+from datetime import datetime
+from html import escape
+from pathlib import Path
+from types import SimpleNamespace
+from urllib.parse import urlparse, parse_qs
+import Scraper
+import Dedup
+import Responses
+import Analyzer
+import FakeBatchAPI
+import Store
+import Ledger
+import PromptCache
+import Cache
+import Relevance
+import ujson
+from requests.models import Response
+
+postPageFileName = "debug.txt" #Saved Reddit post page (~1 MB)
+postsFileName = "data/post_nvidia.csv" #Scraped posts
+evalOutFileName = "requests_out/batch_eval_out.jsonl" #Saved eval batch output
+historyFileName = "log/benchmark_history.jsonl" #One line of results per run
+corpusFileName = Cache.cacheFileName #Captured HTTP cache replayed offline (filled by python main.py scrape)
+
+SCALES = (10, 100, 1000) #Synthetic corpus sizes, multiples of the saved posts
+STOCK = "nvidia"
+REGRESSION_THRESHOLD = 1.25 #Slower than this times the last recorded best is a regression
+REGRESSION_MIN_MS = 5 #...unless it's within this many ms (timer noise)
+
+results = {} #Format: {benchmark name -> best ms}, this run's results for the history file
+
+
+#Times a function over several runs, returns (best, mean) in ms
+def timeIt(func, runs=5):
+    times = []
+    for _ in range(runs):
+        timeStart = time.perf_counter()
+        func()
+        times.append((time.perf_counter()-timeStart)*1000)
+    return min(times), sum(times)/len(times)
+
+#Records a benchmark's best time for the history file
+def record(name, ms):
+    results[name] = round(ms, 3)
+
+#Runs the block quietly (the batch functions print per batch)
+def quiet():
+    return contextlib.redirect_stdout(io.StringIO())
+
+#Runs the block in a fresh temporary working directory with the repo's folder layout and fresh
+#store/ledger/cache connections, so benchmarks never touch real results or hit each other's caches
+@contextlib.contextmanager
+def scratchDir():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        for folder in ("data", "log", "results", "requests_in", "requests_out"): os.mkdir(os.path.join(tmp, folder))
+        os.chdir(tmp); resetConnections()
+        try:
+            yield tmp
+        finally:
+            resetConnections(); os.chdir(cwd)
+
+#Closes the per-thread SQLite connections (they'd keep pointing at the previous directory's files)
+def resetConnections():
+    for module in (Store, Ledger, PromptCache, Cache):
+        conn = getattr(module._local, "conn", None)
+        if conn is not None: conn.close(); module._local.conn = None
+    Cache._cachedBytes = None
+    Relevance._model.clear()
+
+#Whitespace-insensitive form of an extracted (title, description, user) tuple
+def normalizeDetails(details):
+    return tuple(" ".join(field.split()) for field in details)
+
+"""
+=========================================================
+                      SCRAPER
+=========================================================
+"""
+
+#Checks every available post-page backend against the bs4 reference on the saved page, then times them
+def benchmarkParsers(runs=5):
+    with open(postPageFileName, "r", encoding="utf-8") as f:
+        html = f.read()
+    backends = ["bs4"]
+    if Scraper.lxml is not None: backends.append("lxml")
+    if Scraper.HTMLParser is not None: backends.append("selectolax")
+
+    reference = normalizeDetails(Scraper.extractPostDetails(html, "bs4"))
+    for backend in backends:
+        details = normalizeDetails(Scraper.extractPostDetails(html, backend))
+        assert details == reference, backend + " output differs from bs4 on " + postPageFileName
+        best, mean = timeIt(lambda: Scraper.extractPostDetails(html, backend), runs)
+        print("Parser", backend.ljust(10), "| parity OK | best", round(best, 1), "ms | mean", round(mean, 1), "ms")
+        record("parser/" + backend, best)
+
+#Reads the saved posts as tuples
+def loadFixturePosts():
+    with open(postsFileName, "r") as csvF:
+        return [tuple(row) for row in csv.reader(csvF)]
+
+#Scales the saved posts up with reposts: every copy gets a new URL, a tweaked title and a randomly trimmed description
+def syntheticPosts(scale, seed=0):
+    rng = random.Random(seed)
+    posts = loadFixturePosts()
+    synthetic = []
+    for n in range(scale):
+        for url, title, description, ts, karma, comments, user in posts:
+            if n: title = title + rng.choice(["", " !!", " (repost)", " 🚀"]); description = description[:rng.randint(len(description)*3//4, len(description))]
+            synthetic.append((url + "#" + str(n), title, description, ts, karma, comments, user))
+    return synthetic
+
+#Renders posts as a loaded search page (the shreddit cell markup extractSearchCells reads)
+def searchPageHTML(posts):
+    cells = []
+    for url, title, description, ts, karma, comments, user in posts:
+        cells.append('<div class="search-cell"><a data-testid="post-title-text" href="' + urlparse(url).path + "#" + urlparse(url).fragment + '">' + escape(" ".join(title.split())) + '</a>'
+                     '<faceplate-timeago ts="' + ts + '"><time>1 day ago</time></faceplate-timeago>'
+                     '<span><faceplate-number number="' + karma + '">' + karma + '</faceplate-number> <span>votes</span></span>'
+                     '<span><faceplate-number number="' + comments + '">' + comments + '</faceplate-number> <span>comments</span></span></div>')
+    return "<html><body><main>" + "".join(cells) + "</main></body></html>"
+
+#Converts posts to search.json listing pages keyed by their "after" cursor (None for the first page)
+def listingPages(posts):
+    children = []
+    for i, (url, title, description, ts, karma, comments, user) in enumerate(posts):
+        children.append({"kind": "t3", "data": {"id": str(i), "name": "t3_" + str(i), "permalink": urlparse(url).path + "#" + urlparse(url).fragment,
+                                                "created_utc": datetime.strptime(ts, "%Y-%m-%dT%H:%M:%S.%f%z").timestamp(), "score": int(karma),
+                                                "num_comments": int(comments), "title": title, "selftext": description, "author": user.strip("/").split("/")[-1]}})
+    pages = {}; size = Scraper.LISTING_PAGE_SIZE
+    for start in range(0, len(children), size):
+        after = "t3_" + str(start + size - 1) if start + size < len(children) else None
+        pages["t3_" + str(start - 1) if start else None] = {"data": {"children": children[start:start+size], "after": after}}
+    return pages
+
+"""
+=========================================================
+                    SEARCH EXTRACTION
+=========================================================
+"""
+
+#Times reading search cells off a loaded search page (the extractPosts parse, minus the browser)
+def benchmarkSearchExtraction(scales=SCALES):
+    subURL = "https://www.reddit.com/r/wallstreetbets/search/?q=nvidia"
+    for scale in scales:
+        posts = syntheticPosts(scale); html = searchPageHTML(posts)
+        cells = Scraper.extractSearchCells(html, subURL, len(posts))
+        assert [cell[0] for cell in cells] == [post[0] for post in posts], "search cells differ from the rendered posts"
+        assert [(cell[2], cell[3]) for cell in cells] == [(int(post[4]), int(post[5])) for post in posts], "karma/comments differ"
+        best, mean = timeIt(lambda: Scraper.extractSearchCells(html, subURL, len(posts)), 3)
+        print("Search page x" + str(scale).ljust(5), "|", len(posts), "cells,", round(len(html)/1e6, 1), "MB | best", round(best, 1), "ms |",
+              round(best*1000/len(posts), 1), "us/post")
+        record("search/x" + str(scale), best)
+
+#Times walking search.json listing pages into post tuples (extractPostsJSON with recorded pages)
+def benchmarkListingExtraction(scales=SCALES):
+    for scale in scales:
+        posts = syntheticPosts(scale); pages = listingPages(posts)
+        fetchPage = lambda url: pages[parse_qs(urlparse(url).query).get("after", [None])[0]]
+        extracted = list(Scraper.extractPostsJSON("wallstreetbets", STOCK, len(posts), fetchPage=fetchPage))
+        assert [(post[0], post[4], post[5]) for post in extracted] == [("http://reddit.com" + urlparse(post[0]).path + "#" + urlparse(post[0]).fragment, int(post[4]), int(post[5])) for post in posts], "listing posts differ"
+        best, mean = timeIt(lambda: list(Scraper.extractPostsJSON("wallstreetbets", STOCK, len(posts), fetchPage=fetchPage)), 3)
+        print("Listing pages x" + str(scale).ljust(5), "|", len(posts), "posts,", len(pages), "pages | best", round(best, 1), "ms |",
+              round(best*1000/len(posts), 1), "us/post")
+        record("listing/x" + str(scale), best)
+
+#Stores posts in the HTTP cache as a scrape would have: their search.json listing pages and, for every post, html as its page
+def captureCorpus(posts, html):
+    pages = listingPages(posts)
+    def capturePage(url):
+        page = pages[parse_qs(urlparse(url).query).get("after", [None])[0]]
+        Cache.store(url, recordedResponse(url, ujson.dumps(page)))
+        return page
+    list(Scraper.extractPostsJSON("wallstreetbets", STOCK, len(posts), fetchPage=capturePage))
+    for url in {post[0].replace("http://", "https://") for post in posts}: Cache.store(url, recordedResponse(url, html)) #Scraper.fetch requests https
+
+#A 200 response as requests would have returned it
+def recordedResponse(url, text):
+    response = Response()
+    response.url = url; response.status_code = 200; response._content = text.encode("utf-8")
+    return response
+
+#GETs every URL through the cache (OFFLINE, a miss raises Cache.CacheMiss) and parses what the scraper would
+#Returns {"listing": # of listing pages, "post": # of post pages, "other": # of other responses}
+def replayCorpus(urls):
+    counts = {"listing": 0, "post": 0, "other": 0}
+    for url in urls:
+        response = Scraper.fetch(url); path = urlparse(url).path
+        if path.endswith("search.json"): response.json(); counts["listing"] += 1
+        elif "/comments/" in path and not path.endswith(".json"): Scraper.extractPostDetails(response.text); counts["post"] += 1
+        else: counts["other"] += 1
+    return counts
+
+#Times replaying a captured HTTP cache in OFFLINE mode (fetch through the cache + parse, no network)
+#Uses corpusFileName when it exists, otherwise captures the saved posts (smallest scale) first
+def benchmarkReplay(scales=SCALES):
+    corpus = os.path.abspath(corpusFileName); posts = syntheticPosts(min(scales))
+    with open(postPageFileName, "r", encoding="utf-8") as f:
+        html = f.read()
+    with scratchDir():
+        if os.path.exists(corpus):
+            with sqlite3.connect(corpus) as source: source.backup(Cache.getConnection())
+            label = corpusFileName
+        else:
+            captureCorpus(posts, html); label = "synthetic x" + str(min(scales))
+        urls = [row[0] for row in Cache.getConnection().execute("SELECT url FROM responses WHERE status=200")]
+        Cache.OFFLINE = True
+        try:
+            counts = replayCorpus(urls)
+            assert sum(counts.values()) == len(urls) > 0, "nothing replayed from " + label
+            best, mean = timeIt(lambda: replayCorpus(urls), 3)
+        finally:
+            Cache.OFFLINE = False
+    print("Offline replay", label, "|", counts["listing"], "listing pages,", counts["post"], "post pages,", counts["other"], "other | best",
+          round(best, 1), "ms |", round(best*1000/len(urls), 1), "us/response")
+    record("replay", best)
+
+"""
+=========================================================
+                      ANALYZER
+=========================================================
+"""
+
+#Times near-duplicate clustering on the saved posts scaled up with synthetic reposts
+def benchmarkDedup(scales=(1, 10, 100, 1000)):
+    for scale in scales:
+        posts = syntheticPosts(scale)
+        timeStart = time.perf_counter()
+        representatives, clusterOf = Dedup.dedupePosts(posts)
+        elapsed = time.perf_counter() - timeStart
+        print("Dedup x" + str(scale).ljust(5), "|", len(posts), "posts ->", len(representatives), "representatives |",
+              round(elapsed*1000, 1), "ms |", round(elapsed*1e6/len(posts), 1), "us/post")
+        record("dedup/x" + str(scale), elapsed*1000)
+
+#The old split(" | ") parse from stockAnalyze, for comparison: (score, justification) or None
+def splitParse(content):
+    rating = content.split(" | ")
+    if len(rating) < 2: return None
+    try:
+        return float(rating[0]), rating[1]
+    except ValueError:
+        return None
+
+#Times the eval answer parser against the old split parse on the saved batch output (repeated to scale)
+def benchmarkResponseParser(scale=1000):
+    with open(evalOutFileName, "r") as f:
+        contents = [ujson.loads(line)["response"]["body"]["choices"][0]["message"]["content"] for line in f if line.strip()]
+    for content in contents: #Both must agree wherever the old parse worked
+        old = splitParse(content); new = Responses.parseEval(content)
+        assert old is None or old[0] == new[0], content
+    corpus = contents * scale
+    for name, parse in [("split", splitParse), ("regex", Responses.parseEval)]:
+        best, mean = timeIt(lambda: [parse(content) for content in corpus], 3)
+        failed = sum(parse(content) in (None, (None, "", 0)) for content in contents)
+        print("Response parser", name.ljust(5), "|", len(corpus), "answers | best", round(best, 1), "ms |",
+              round(best*1000/len(corpus), 3), "us/answer |", failed, "of", len(contents), "unparseable")
+        record("responses/" + name, best)
+
+#Times write_jsonl/read_jsonl round trips of formatted eval requests
+def benchmarkJSONL(scales=SCALES):
+    for scale in scales:
+        dataList = [Analyzer.formatRequest(post[0], Analyzer.generatePrompts_Eval(post[1], post[2], STOCK)) for post in syntheticPosts(scale)]
+        with scratchDir():
+            fileName = "requests_in/batch_eval_in.jsonl"
+            Analyzer.write_jsonl(fileName, dataList)
+            assert list(Analyzer.read_jsonl(fileName)) == dataList, "read_jsonl differs from what write_jsonl wrote"
+            bestWrite, mean = timeIt(lambda: Analyzer.write_jsonl(fileName, dataList), 3)
+            bestRead, mean = timeIt(lambda: list(Analyzer.read_jsonl(fileName)), 3)
+            size = os.path.getsize(fileName)
+        print("JSONL x" + str(scale).ljust(5), "|", len(dataList), "requests,", round(size/1e6, 1), "MB | write", round(bestWrite, 1), "ms | read", round(bestRead, 1), "ms")
+        record("jsonl_write/x" + str(scale), bestWrite); record("jsonl_read/x" + str(scale), bestRead)
+
+#Times createBatch_BWAnalysis/createBatch_Eval end to end (format, cache filter, plan, write, submit, poll, ingest)
+#against the in-process fake client; dedup and the local prefilter are off so every post becomes a request
+#(both are timed on their own), and each run starts from empty results/ledger/prompt cache
+def benchmarkCreateBatch(scales=SCALES):
+    settings = (Analyzer.client, Analyzer.POLL_MIN_INTERVAL, Analyzer.DEDUP_NEAR_DUPLICATES, Analyzer.LOCAL_PREFILTER_BW)
+    Analyzer.POLL_MIN_INTERVAL = 0; Analyzer.DEDUP_NEAR_DUPLICATES = False; Analyzer.LOCAL_PREFILTER_BW = False
+    try:
+        for scale in scales:
+            posts = syntheticPosts(scale)
+            for kind, createBatch, csvFileName in [("bw", Analyzer.createBatch_BWAnalysis, Responses.resultsFileName(Analyzer.BWFileName, STOCK)),
+                                                 ("eval", Analyzer.createBatch_Eval, Responses.resultsFileName(Analyzer.EvalFileName, STOCK))]:
+                with scratchDir():
+                    Analyzer.client = FakeBatchAPI.FakeClient()
+                    timeStart = time.perf_counter()
+                    with quiet(): createBatch(posts, STOCK, confirmMsg=False)
+                    elapsed = (time.perf_counter() - timeStart)*1000
+                    with open(csvFileName, "r") as csvF:
+                        rows = sum(1 for row in csv.reader(csvF))
+                    assert rows == len(posts), kind + ": " + str(rows) + " result rows for " + str(len(posts)) + " posts"
+                print("createBatch", kind.ljust(4), "x" + str(scale).ljust(5), "|", len(posts), "posts |", round(elapsed, 1), "ms |",
+                      round(elapsed*1000/len(posts), 1), "us/post (fake API included)")
+                record("createBatch_" + kind + "/x" + str(scale), elapsed)
+    finally:
+        Analyzer.client, Analyzer.POLL_MIN_INTERVAL, Analyzer.DEDUP_NEAR_DUPLICATES, Analyzer.LOCAL_PREFILTER_BW = settings
+
+#Times retrieveBatchResult on the saved eval batch output, repeated to scale with unique url|hash custom ids
+def benchmarkIngestion(scales=SCALES):
+    with open(evalOutFileName, "r") as f:
+        outputs = [ujson.loads(line) for line in f if line.strip()]
+    answered = sum(Analyzer.parseResultLine(ujson.dumps(output)) is not None for output in outputs)
+    for scale in scales:
+        lines = []
+        for n in range(scale):
+            for i, output in enumerate(outputs):
+                output["custom_id"] = output["custom_id"].split("|")[-1].split("#")[0] + "#" + str(n) + "|" + "%016x" % (n*len(outputs) + i)
+                lines.append(ujson.dumps(output, escape_forward_slashes=False))
+        content = ("\n".join(lines) + "\n").encode("utf-8")
+        times = []
+        for _ in range(3):
+            with scratchDir():
+                client = FakeBatchAPI.FakeClient()
+                batch = SimpleNamespace(id="batch_benchmark", status="completed", output_file_id=client.state.addFile("output.jsonl", content)["id"], metadata={})
+                settings = Analyzer.client; Analyzer.client = client
+                try:
+                    timeStart = time.perf_counter()
+                    with quiet(): parsedIds = Analyzer.retrieveBatchResult(batch, "requests_out/batch_eval_out.jsonl", Analyzer.EvalFileName, "eval")
+                    times.append((time.perf_counter() - timeStart)*1000)
+                finally:
+                    Analyzer.client = settings
+                assert len(parsedIds) == answered*scale, "ingested " + str(len(parsedIds)) + " of " + str(answered*scale) + " answers"
+        print("Ingestion x" + str(scale).ljust(5), "|", len(lines), "output lines,", round(len(content)/1e6, 1), "MB | best", round(min(times), 1), "ms |",
+              round(min(times)*1000/len(lines), 1), "us/line")
+        record("ingestion/x" + str(scale), min(times))
+
+"""
+=========================================================
+                       STARTUP
+=========================================================
+"""
+
+HEAVY_MODULES = ("selenium", "openai", "nltk", "pandas", "bs4", "requests", "numpy")
+LAZY_IMPORTS = { #Module -> heavy modules importing it must not load (they're imported on first use)
+    "main": HEAVY_MODULES,
+    "Store": HEAVY_MODULES,
+    "Scraper": ("selenium", "openai", "nltk", "pandas"),
+    "Analyzer": ("selenium", "openai", "nltk", "pandas"),
+}
+STARTUP_COMMANDS = [ #(name, python arguments), each timed as a fresh process
+    ("python", ["-c", "pass"]),
+    ("import_main", ["-c", "import main"]),
+    ("main_help", ["main.py", "--help"]),
+    ("main_status", ["main.py", "status"]),
+    ("import_Scraper", ["-c", "import Scraper"]),
+    ("import_Analyzer", ["-c", "import Analyzer"]),
+]
+
+#Checks that importing main and the core modules leaves the heavy dependencies unloaded, then times fresh
+#interpreter startups (python main.py status runs in a scratch directory)
+def benchmarkStartup(scales=SCALES, runs=5):
+    repoDir = str(Path(__file__).resolve().parent)
+    env = dict(os.environ, PYTHONPATH=repoDir)
+    for module, forbidden in LAZY_IMPORTS.items():
+        check = "import sys, " + module + "; print(','.join(m for m in " + repr(forbidden) + " if m in sys.modules))"
+        loaded = subprocess.run([sys.executable, "-c", check], capture_output=True, text=True, env=env, cwd=repoDir, check=True).stdout.strip()
+        assert not loaded, "import " + module + " loads " + loaded
+    with scratchDir() as tmp:
+        for name, arguments in STARTUP_COMMANDS:
+            command = [sys.executable] + [os.path.join(repoDir, arg) if arg.endswith(".py") else arg for arg in arguments]
+            best, mean = timeIt(lambda: subprocess.run(command, capture_output=True, env=env, cwd=tmp, check=True), runs)
+            print("Startup", name.ljust(16), "| best", round(best, 1), "ms | mean", round(mean, 1), "ms")
+            record("startup/" + name, best)
+
+"""
+=========================================================
+                       HISTORY
+=========================================================
+"""
+
+#Short hash of the checked out commit, "" outside a git checkout
+def gitCommit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+#Compares this run with the latest recorded result of each benchmark on this machine, then appends it to the history
+#Returns the names of the benchmarks that regressed
+def recordHistory(fileName=historyFileName):
+    machine = platform.node() + " " + platform.machine()
+    previous = {} #Format: {name -> (ms, commit)}, latest per benchmark
+    if Path(fileName).exists():
+        with open(fileName, "r") as f:
+            for line in f:
+                run = json.loads(line)
+                if run.get("machine") == machine: previous.update({name: (ms, run.get("commit", "")) for name, ms in run["results"].items()})
+
+    regressions = []
+    for name, ms in results.items():
+        if name not in previous: continue
+        before, commit = previous[name]
+        if ms > before*REGRESSION_THRESHOLD and ms - before > REGRESSION_MIN_MS:
+            regressions.append(name)
+            print("REGRESSION", name, "|", round(before, 1), "ms (" + (commit or "?") + ") ->", round(ms, 1), "ms")
+    print("Benchmarks:", len(results), "results,", len([name for name in results if name in previous]), "compared with history,", len(regressions), "regressions")
+
+    Path(fileName).parent.mkdir(parents=True, exist_ok=True)
+    with open(fileName, "a") as f:
+        f.write(json.dumps({"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": gitCommit(), "machine": machine,
+                            "python": platform.python_version(), "results": results}) + "\n")
+    return regressions
+
+BENCHMARKS = { #Name -> benchmark taking the corpus scales
+    "startup": benchmarkStartup,
+    "parsers": lambda scales: benchmarkParsers(),
+    "search": benchmarkSearchExtraction,
+    "listing": benchmarkListingExtraction,
+    "replay": benchmarkReplay,
+    "dedup": benchmarkDedup,
+    "responses": lambda scales: benchmarkResponseParser(max(scales)),
+    "jsonl": benchmarkJSONL,
+    "createBatch": benchmarkCreateBatch,
+    "ingestion": benchmarkIngestion,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline WallScrape benchmarks")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="benchmarks to run (default: all)")
+    parser.add_argument("--scales", nargs="+", type=int, default=list(SCALES), help="synthetic corpus sizes as multiples of the saved posts")
+    parser.add_argument("--corpus", default=corpusFileName, help="captured HTTP cache for the replay benchmark (synthetic corpus if missing)")
+    parser.add_argument("--no-history", action="store_true", help="don't compare with or append to " + historyFileName)
+    args = parser.parse_args()
+    corpusFileName = args.corpus
+    for name in args.only or BENCHMARKS:
+        BENCHMARKS[name](args.scales)
+    if not args.no_history and recordHistory(): sys.exit(1)
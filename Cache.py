@@ -0,0 +1,139 @@
+import threading
+import hashlib
+import json
+import time
+import zlib
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+import Metrics
+import Database
+
+"""
+On-disk HTTP response cache for the scraper. Bodies are zlib-compressed in SQLite, keyed by a hash
+of the URL, with per-resource TTLs (post pages live long, listings/vote counts expire fast),
+ETag/If-Modified-Since revalidation once an entry goes stale and LRU eviction under a size cap.
+
+OFFLINE mode serves everything from the cache regardless of age and never touches the network,
+so the parser/analyzer pipeline can be re-run and benchmarked against a captured corpus
+(python main.py scrape --offline, python Benchmark.py --only replay).
+
+@author Victor Gong
+@version 10/18/2026
+"""
+
+cacheFileName = "data/http_cache.sqlite"
+
+ENABLED = True #Route scraper GETs through the cache
+OFFLINE = False #Replay only: serve cached responses even if stale, raise CacheMiss instead of fetching
+MAX_CACHE_BYTES = 512*1024*1024 #Compressed size cap, least recently used entries evicted past this
+
+TTL_RULES = [ #(URL substring, seconds), first match wins
+    ("/by_id/", 10*60), #Karma/comment refreshes
+    ("search.json", 10*60), #Search listings
+    ("/search/", 10*60),
+    ("reddit.com/comments/", 3600), #Comment thread .json (new comments keep coming)
+    ("/api/morechildren", 3600),
+    ("/comments/", 30*24*3600), #Post pages (body rarely changes)
+]
+DEFAULT_TTL = 24*3600
+
+
+class CacheMiss(Exception):
+    pass
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS responses (
+        key TEXT PRIMARY KEY, url TEXT, finalUrl TEXT, status INTEGER, headers TEXT,
+        body BLOB, size INTEGER, fetchedAt REAL, accessedAt REAL, ttl REAL)""",
+    "CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessedAt)",
+)
+
+_local = threading.local()
+_sizeLock = threading.Lock()
+_cachedBytes = None #Running compressed size of the cache (this process's writes), None until first read
+
+def getConnection():
+    return Database.connect(_local, cacheFileName, SCHEMA)
+
+def cacheKey(url):
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+#Seconds a response for this URL stays fresh
+def ttlFor(url):
+    for sub, ttl in TTL_RULES:
+        if sub in url: return ttl
+    return DEFAULT_TTL
+
+#Rebuilds a requests Response from a cache row so callers can't tell it apart from a live one
+def toResponse(row):
+    finalUrl, status, headers, body = row
+    response = Response()
+    response.url = finalUrl; response.status_code = status
+    response.headers = CaseInsensitiveDict(json.loads(headers))
+    response._content = zlib.decompress(body)
+    response.encoding = "utf-8"
+    return response
+
+#Stores a 200 response (only revalidation headers are kept)
+def store(url, response):
+    body = zlib.compress(response.content, 6)
+    headers = {h: response.headers[h] for h in ("ETag", "Last-Modified", "Content-Type") if h in response.headers}
+    now = time.time(); key = cacheKey(url)
+    conn = getConnection()
+    with conn:
+        old = conn.execute("SELECT size FROM responses WHERE key=?", (key,)).fetchone()
+        conn.execute("INSERT OR REPLACE INTO responses VALUES (?,?,?,?,?,?,?,?,?,?)",
+                     (key, url, response.url, response.status_code, json.dumps(headers), body, len(body), now, now, ttlFor(url)))
+    if trackSize(len(body) - (old[0] if old else 0)) > MAX_CACHE_BYTES: evict()
+
+#Adds delta bytes to the running cache size (summed from the table on first use), returns the new total
+def trackSize(delta):
+    global _cachedBytes
+    with _sizeLock:
+        if _cachedBytes is None: _cachedBytes = totalSize() #Includes the write being tracked
+        else: _cachedBytes += delta
+        return _cachedBytes
+
+#Compressed size of every cached response
+def totalSize():
+    return getConnection().execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+#Drops least recently used entries until the cache fits under MAX_CACHE_BYTES
+#Only runs once the running size passes the cap, and re-sums the table first (other processes write to it too)
+def evict():
+    global _cachedBytes
+    conn = getConnection()
+    total = totalSize()
+    if total > MAX_CACHE_BYTES:
+        with conn:
+            for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessedAt").fetchall():
+                conn.execute("DELETE FROM responses WHERE key=?", (key,))
+                total -= size
+                if total <= MAX_CACHE_BYTES: break
+    with _sizeLock: _cachedBytes = total
+
+#GETs a URL through the cache. fetchNetwork(extraHeaders) performs the real request.
+def fetchCached(url, fetchNetwork):
+    conn = getConnection()
+    key = cacheKey(url)
+    row = conn.execute("SELECT finalUrl, status, headers, body, fetchedAt, ttl FROM responses WHERE key=?", (key,)).fetchone()
+    if row and (OFFLINE or time.time() - row[4] < row[5]):
+        with conn: conn.execute("UPDATE responses SET accessedAt=? WHERE key=?", (time.time(), key))
+        Metrics.inc("cache_lookups", result="hit")
+        return toResponse(row[:4])
+    if OFFLINE: raise CacheMiss(url)
+
+    #Stale or missing, revalidate when the server gave us validators
+    conditional = {}
+    if row:
+        headers = json.loads(row[2])
+        if "ETag" in headers: conditional["If-None-Match"] = headers["ETag"]
+        if "Last-Modified" in headers: conditional["If-Modified-Since"] = headers["Last-Modified"]
+    response = fetchNetwork(conditional)
+    if response.status_code == 304 and row:
+        with conn: conn.execute("UPDATE responses SET fetchedAt=?, accessedAt=? WHERE key=?", (time.time(), time.time(), key))
+        Metrics.inc("cache_lookups", result="revalidated")
+        return toResponse(row[:4])
+    Metrics.inc("cache_lookups", result="miss")
+    if response.status_code == 200: store(url, response)
+    return response
@@ -0,0 +1,36 @@
+import sqlite3
+from pathlib import Path
+
+"""
+Shared SQLite plumbing for the modules that keep their state in a database file (Store, Cache,
+Ledger, PromptCache, Aggregate). Each of them holds a threading.local and gets its connection
+through connect(), which opens the file (creating its directory), switches it to WAL so readers
+don't block the writer, and creates the module's schema on first use per thread. selectIn() runs
+lookups by a list of keys in chunks that fit SQLite's bound-parameter limit.
+
+@author Victor Gong
+@version 10/18/2026
+"""
+
+TIMEOUT = 30 #Seconds a connection waits on a locked database before raising
+IN_CHUNK = 900 #Keys per IN (...) list (SQLite allows 999 bound parameters by default)
+
+
+#Returns this thread's connection to fileName (kept in local.conn), creating the directory and schema on first use
+def connect(local, fileName, schema):
+    if getattr(local, "conn", None) is None:
+        Path(fileName).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(fileName, timeout=TIMEOUT)
+        conn.execute("PRAGMA journal_mode=WAL")
+        for statement in schema: conn.execute(statement)
+        local.conn = conn
+    return local.conn
+
+#Runs sql, whose "{}" is replaced by an IN list placeholder, for values in chunks; params are bound before each chunk
+#Returns all rows, e.g. selectIn(conn, "SELECT url, ts FROM posts WHERE url IN ({})", urls)
+def selectIn(conn, sql, values, params=()):
+    values = list(values); rows = []
+    for i in range(0, len(values), IN_CHUNK):
+        chunk = values[i:i+IN_CHUNK]
+        rows += conn.execute(sql.format(",".join("?"*len(chunk))), tuple(params) + tuple(chunk)).fetchall()
+    return rows
@@ -0,0 +1,114 @@
+import re
+import csv
+from pathlib import Path
+import numpy as np
+import Responses
+
+"""
+Near-duplicate filter run before posts reach the LLM stage. Reposts, crossposts and near-identical
+"NVDA to the moon" posts are clustered with MinHash signatures over title+description and an LSH
+band index (only posts sharing a band bucket are ever compared, so it stays sub-quadratic), then
+only one representative per cluster is classified and its label is fanned back out to the rest.
+
+@author Victor Gong
+@version 10/18/2026
+"""
+
+SHINGLE_SIZE = 5 #Character n-grams (short titles have too few words for word shingles)
+NUM_PERM = 64 #MinHash signature length (power of two, one bin per signature slot)
+BANDS = 16 #LSH bands (NUM_PERM/BANDS rows each), candidate threshold ~ (1/BANDS)^(1/rows)
+SIMILARITY_THRESHOLD = 0.8 #Estimated Jaccard needed to count as a duplicate
+MAX_TEXT_CHARS = 1000 #Only the start of long posts is shingled (same as Analyzer.TEXT_MAX_CUTOFF)
+
+_BIN_SHIFT = np.uint64(64 - NUM_PERM.bit_length() + 1) #Top bits of a shingle hash pick its bin
+_VALUE_MASK = np.uint64((1 << int(_BIN_SHIFT)) - 1)
+_EMPTY = np.uint64(2**64 - 1)
+
+#Lowercases and strips URLs/punctuation so trivial edits don't change the shingles
+def normalizeText(title, description):
+    text = (title + " " + description)[:MAX_TEXT_CHARS*2].lower()
+    text = re.sub(r"https?://\S+", " ", text)
+    return " ".join(re.sub(r"[^a-z0-9$]+", " ", text).split())
+
+#Hashed character shingles of a text (unique uint64 array), rolling polynomial hash computed with vector ops
+def shingleHashes(text):
+    data = np.frombuffer(text[:MAX_TEXT_CHARS].ljust(SHINGLE_SIZE).encode("utf-8"), dtype=np.uint8).astype(np.uint64)
+    count = len(data) - SHINGLE_SIZE + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    for j in range(SHINGLE_SIZE):
+        hashes = hashes*np.uint64(257) + data[j:j+count]
+    return np.unique(hashes)
+
+#One-permutation MinHash signature: every shingle is hashed once, its top bits pick one of NUM_PERM bins
+#and each bin keeps its minimum. Empty bins borrow the next filled bin's value (densification) so
+#signatures of short texts stay comparable. O(shingles) per post instead of O(shingles * NUM_PERM).
+def signature(hashes):
+    mixed = hashes * np.uint64(0x9E3779B97F4A7C15) #splitmix64 finalizer
+    mixed ^= mixed >> np.uint64(32); mixed *= np.uint64(0xBF58476D1CE4E5B9); mixed ^= mixed >> np.uint64(29)
+    sig = np.full(NUM_PERM, _EMPTY, dtype=np.uint64)
+    np.minimum.at(sig, (mixed >> _BIN_SHIFT).astype(np.intp), mixed & _VALUE_MASK)
+
+    filled = np.nonzero(sig != _EMPTY)[0]
+    if 0 < len(filled) < NUM_PERM:
+        bins = np.arange(NUM_PERM)
+        source = filled[np.searchsorted(filled, bins) % len(filled)] #Next filled bin, wrapping around
+        sig = sig[source] + ((source - bins) % NUM_PERM).astype(np.uint64) * (_VALUE_MASK + np.uint64(1))
+    return sig
+
+#Union-find root lookup with path halving
+def findRoot(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+#Clusters posts by near-duplicate title+description, returns a list of clusters in input order
+#(lists of indices, roots are always the lowest index so the first entry is the earliest post)
+def clusterPosts(posts):
+    cache = {} #Exact reposts share one signature computation
+    signatures = np.empty((len(posts), NUM_PERM), dtype=np.uint64)
+    for i, (url, title, description, ts, karma, comments, user) in enumerate(posts):
+        text = normalizeText(title, description)
+        if text not in cache: cache[text] = signature(shingleHashes(text))
+        signatures[i] = cache[text]
+    rows = NUM_PERM // BANDS
+    parent = list(range(len(posts)))
+    for band in range(BANDS):
+        buckets = {}
+        for i, key in enumerate(map(bytes, signatures[:, band*rows:(band+1)*rows])):
+            buckets.setdefault(key, []).append(i)
+        for bucket in buckets.values():
+            for j in bucket[1:]: #Verify candidates against the bucket's first post
+                rootI = findRoot(parent, bucket[0]); rootJ = findRoot(parent, j)
+                if rootI != rootJ and np.count_nonzero(signatures[bucket[0]] == signatures[j]) >= SIMILARITY_THRESHOLD*NUM_PERM:
+                    parent[max(rootI, rootJ)] = min(rootI, rootJ)
+
+    clusters = {}
+    for i in range(len(posts)):
+        clusters.setdefault(findRoot(parent, i), []).append(i)
+    return list(clusters.values())
+
+#Returns (representative posts, {duplicate url -> representative url})
+def dedupePosts(posts):
+    posts = list(posts)
+    if not posts: return [], {}
+    representatives = []; clusterOf = {}
+    for cluster in clusterPosts(posts):
+        rep = posts[cluster[0]]
+        representatives.append(rep)
+        for i in cluster[1:]:
+            if posts[i][0] != rep[0]: clusterOf[posts[i][0]] = rep[0]
+    print("Dedup:", len(posts), "posts ->", len(representatives), "representatives (" + str(len(clusterOf)), "near-duplicates)")
+    return representatives, clusterOf
+
+#Appends each representative's result to the .csv for its duplicates that don't have one yet
+def fanOutResults(csvFileName, clusterOf):
+    if not clusterOf or not Path(csvFileName).exists(): return
+    results = Responses.loadResults(csvFileName) #Answer and its typed columns
+    fanned = 0
+    with Responses.appendResults(csvFileName) as csvF:
+        csvWriter = csv.writer(csvF)
+        for url, repUrl in clusterOf.items():
+            if url not in results and repUrl in results:
+                csvWriter.writerow([url] + results[repUrl]); fanned += 1
+    print("Dedup: fanned", fanned, "results out to near-duplicates in", csvFileName)
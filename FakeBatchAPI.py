@@ -0,0 +1,166 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from email.parser import BytesParser
+import threading
+import json
+import time
+import uuid
+from types import SimpleNamespace
+from contextlib import contextmanager
+
+"""
+Local stand-in for the OpenAI Files + Batch API, for exercising the batch orchestration without
+spending money. Supports file upload/content, batch create/retrieve/list; batches go
+validating -> in_progress -> completed after a few polls and answer every request with a canned reply.
+
+Usage:
+   server, baseURL = FakeBatchAPI.startServer()
+   Analyzer.client = OpenAI(api_key="fake", base_url=baseURL)
+
+@author Victor Gong
+@version 10/18/2026
+"""
+
+
+#Default canned reply: Y for the related/not-related prompt, a JSON list for packed prompts, a score otherwise
+def defaultResponder(body):
+    prompt = body["messages"][-1]["content"]
+    if "response_format" in body: #Packed request, one answer per "[i]" numbered post
+        return json.dumps({"posts": [{"id": i, "related": "Y", "score": 25} for i in range(prompt.count("\n["))]})
+    return "Y" if "strictly Y or N" in prompt else "25 | Bullish"
+
+class FakeBatchState:
+    def __init__(self, pollsUntilDone, responder):
+        self.pollsUntilDone = pollsUntilDone
+        self.responder = responder
+        self.files = {} #Format: {file id -> (filename, bytes)}
+        self.batches = {} #Format: {batch id -> batch dict}
+        self.polls = {} #Format: {batch id -> # of retrieves}
+        self.lock = threading.Lock()
+
+    def addFile(self, filename, content):
+        fileId = "file-" + uuid.uuid4().hex[:24]
+        self.files[fileId] = (filename, content)
+        return {"id": fileId, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                "filename": filename, "purpose": "batch", "status": "processed"}
+
+    #Runs every request of a batch's input file through the responder and stores the output file
+    def completeBatch(self, batch):
+        lines = []
+        for line in self.files[batch["input_file_id"]][1].decode("utf-8").splitlines():
+            if not line.strip(): continue
+            request = json.loads(line)
+            content = self.responder(request["body"])
+            promptTokens = sum(len(m["content"]) for m in request["body"]["messages"]) // 4 + 7; completionTokens = len(content) // 4 + 1 #Rough usage
+            lines.append(json.dumps({"id": "batch_req_" + uuid.uuid4().hex[:24], "custom_id": request["custom_id"], "response": {
+                "status_code": 200, "request_id": uuid.uuid4().hex, "body": {
+                    "id": "chatcmpl-" + uuid.uuid4().hex[:24], "object": "chat.completion", "created": int(time.time()), "model": request["body"]["model"],
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "logprobs": None, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": promptTokens, "completion_tokens": completionTokens, "total_tokens": promptTokens + completionTokens}}}, "error": None}))
+        output = self.addFile("batch_output.jsonl", ("\n".join(lines) + "\n").encode("utf-8"))
+        batch.update(status="completed", output_file_id=output["id"], completed_at=int(time.time()),
+                     request_counts={"total": len(lines), "completed": len(lines), "failed": 0})
+
+    def createBatch(self, request):
+        batch = {"id": "batch_" + uuid.uuid4().hex[:24], "object": "batch", "endpoint": request["endpoint"], "errors": None,
+                 "input_file_id": request["input_file_id"], "completion_window": request["completion_window"], "status": "validating",
+                 "output_file_id": None, "error_file_id": None, "created_at": int(time.time()), "metadata": request.get("metadata"),
+                 "request_counts": {"total": 0, "completed": 0, "failed": 0}}
+        self.batches[batch["id"]] = batch; self.polls[batch["id"]] = 0
+        return batch
+
+    #Counts a poll and moves the batch along: validating -> in_progress -> completed after pollsUntilDone polls
+    def retrieveBatch(self, batchId):
+        batch = self.batches[batchId]
+        self.polls[batchId] += 1
+        if batch["status"] == "validating": batch.update(status="in_progress", in_progress_at=int(time.time()))
+        if batch["status"] == "in_progress" and self.polls[batchId] >= self.pollsUntilDone: self.completeBatch(batch)
+        return batch
+
+class FakeBatchHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args): pass #Keep test output quiet
+
+    def sendJSON(self, obj, status=200):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json"); self.send_header("Content-Length", str(len(body)))
+        self.end_headers(); self.wfile.write(body)
+
+    def readBody(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        state = self.server.state
+        if self.path.startswith("/v1/files"): #multipart/form-data upload
+            message = BytesParser().parsebytes(b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + self.readBody())
+            for part in message.get_payload():
+                if part.get_param("name", header="content-disposition") == "file":
+                    with state.lock: return self.sendJSON(state.addFile(part.get_filename(), part.get_payload(decode=True)))
+            return self.sendJSON({"error": {"message": "missing file"}}, 400)
+        if self.path.startswith("/v1/batches"):
+            request = json.loads(self.readBody())
+            with state.lock: return self.sendJSON(state.createBatch(request))
+        self.sendJSON({"error": {"message": "not found"}}, 404)
+
+    def do_GET(self):
+        state = self.server.state
+        parts = self.path.split("?")[0].strip("/").split("/")
+        with state.lock:
+            if parts == ["v1", "batches"]:
+                batches = list(reversed(list(state.batches.values()))) #Newest first like the real API
+                return self.sendJSON({"object": "list", "data": batches, "has_more": False,
+                                      "first_id": batches[0]["id"] if batches else None, "last_id": batches[-1]["id"] if batches else None})
+            if parts[:2] == ["v1", "batches"] and len(parts) == 3 and parts[2] in state.batches:
+                return self.sendJSON(state.retrieveBatch(parts[2]))
+            if parts[:2] == ["v1", "files"] and len(parts) == 4 and parts[3] == "content" and parts[2] in state.files:
+                content = state.files[parts[2]][1]
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream"); self.send_header("Content-Length", str(len(content)))
+                self.end_headers(); self.wfile.write(content)
+                return
+        self.sendJSON({"error": {"message": "not found"}}, 404)
+
+#Starts the fake API on a background thread, returns (server, base URL for OpenAI(base_url=...))
+def startServer(port=0, pollsUntilDone=2, responder=defaultResponder):
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeBatchHandler)
+    server.state = FakeBatchState(pollsUntilDone, responder)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:" + str(server.server_address[1]) + "/v1"
+
+"""
+In-process client with the same state and replies, no server or HTTP in between (for benchmarks,
+where the loopback round trips would swamp the code being timed). Covers the calls Analyzer makes.
+
+Usage:
+   Analyzer.client = FakeBatchAPI.FakeClient()
+"""
+
+class FakeClient:
+    def __init__(self, pollsUntilDone=1, responder=defaultResponder):
+        self.state = FakeBatchState(pollsUntilDone, responder)
+        self.files = FakeFiles(self.state); self.batches = FakeBatches(self.state)
+
+class FakeFiles:
+    def __init__(self, state):
+        self.state = state
+        self.with_streaming_response = self
+
+    def create(self, file, purpose):
+        with self.state.lock: return SimpleNamespace(**self.state.addFile(getattr(file, "name", "upload.jsonl"), file.read()))
+
+    #Streaming content (files.with_streaming_response.content), read as lines like the real response
+    @contextmanager
+    def content(self, fileId):
+        yield SimpleNamespace(iter_lines=lambda: iter(self.state.files[fileId][1].decode("utf-8").splitlines()))
+
+class FakeBatches:
+    def __init__(self, state):
+        self.state = state
+
+    def create(self, **request):
+        with self.state.lock: return SimpleNamespace(**self.state.createBatch(request))
+
+    def retrieve(self, batchId):
+        with self.state.lock: return SimpleNamespace(**self.state.retrieveBatch(batchId))
+
+    def list(self, limit=20):
+        with self.state.lock: return [SimpleNamespace(**batch) for batch in reversed(list(self.state.batches.values()))][:limit]
@@ -0,0 +1,122 @@
+import threading
+import time
+import Database
+
+"""
+Durable job ledger for the Batch API pipeline. Every request (post URL per analysis kind) moves
+planned -> submitted (with its batch id) -> completed -> parsed, and every input file is recorded
+with the batch it became. A restarted run picks up in-flight batches from here and skips posts
+that were already sent, so nothing we've paid for is ever submitted twice. Packed requests (several
+posts per request) also record which posts they carry, in answer order.
+
+@author Victor Gong
+@version 10/18/2026
+"""
+
+ledgerFileName = "log/ledger.sqlite"
+
+TAKEN_STATES = ("submitted", "completed", "parsed") #Posts in these states are never sent again
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS files (
+        inFile TEXT PRIMARY KEY, kind TEXT, outFile TEXT, batchId TEXT, status TEXT, updatedAt REAL)""",
+    "CREATE INDEX IF NOT EXISTS files_batch ON files(batchId)",
+    """CREATE TABLE IF NOT EXISTS jobs (
+        kind TEXT, customId TEXT, inFile TEXT, state TEXT, updatedAt REAL, PRIMARY KEY (kind, customId))""",
+    "CREATE INDEX IF NOT EXISTS jobs_file ON jobs(inFile)",
+    """CREATE TABLE IF NOT EXISTS packs (
+        kind TEXT, customId TEXT, position INTEGER, url TEXT, hash TEXT, PRIMARY KEY (kind, customId, position))""",
+)
+
+_local = threading.local()
+
+
+def getConnection():
+    return Database.connect(_local, ledgerFileName, SCHEMA)
+
+#Returns the custom ids of a kind that are submitted or done (skip these when building new batches),
+#including the single-post ids (url|hash) of posts riding in packed requests that are still in flight
+#(members of parsed packs are in the prompt cache, failed ones are free to be sent again)
+def takenIds(kind):
+    conn = getConnection()
+    rows = conn.execute("SELECT customId FROM jobs WHERE kind=? AND state IN (?,?,?)", (kind,) + TAKEN_STATES)
+    packed = conn.execute("""SELECT packs.url || '|' || packs.hash FROM packs JOIN jobs USING (kind, customId)
+        WHERE kind=? AND jobs.state IN ('submitted','completed')""", (kind,))
+    return {row[0] for row in rows} | {row[0] for row in packed}
+
+#Records a written (not yet submitted) input file and its requests
+def planFile(kind, inFile, outFile, customIds):
+    conn = getConnection(); now = time.time()
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO files VALUES (?,?,?,NULL,'planned',?)", (inFile, kind, outFile, now))
+        conn.executemany("INSERT OR REPLACE INTO jobs VALUES (?,?,?,'planned',?)", [(kind, c, inFile, now) for c in customIds])
+
+#Records the posts of packed requests: {pack custom id -> [(url, prompt hash of the post's single request),...]}
+def planPacks(kind, packs):
+    conn = getConnection()
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO packs VALUES (?,?,?,?,?)",
+                         [(kind, customId, i, url, h) for customId, members in packs.items() for i, (url, h) in enumerate(members)])
+
+#Returns [(url, prompt hash),...] of a packed request in pack order (answer ids are positions in this list)
+def packMembers(kind, customId):
+    rows = getConnection().execute("SELECT url, hash FROM packs WHERE kind=? AND customId=? ORDER BY position", (kind, customId))
+    return rows.fetchall()
+
+#Records the batch an input file became (call right after the batch is created)
+def submitFile(inFile, batchId):
+    conn = getConnection(); now = time.time()
+    with conn:
+        conn.execute("UPDATE files SET batchId=?, status='submitted', updatedAt=? WHERE inFile=?", (batchId, now, inFile))
+        conn.execute("UPDATE jobs SET state='submitted', updatedAt=? WHERE inFile=?", (now, inFile))
+
+#Returns {inFile -> outFile} of files written but never confirmed as submitted (crash between upload and ledger write)
+def plannedFiles(kind):
+    rows = getConnection().execute("SELECT inFile, outFile FROM files WHERE kind=? AND status='planned'", (kind,))
+    return dict(rows.fetchall())
+
+#Drops a planned file that never became a batch, its requests can be sent again
+def abandonFile(inFile):
+    conn = getConnection(); now = time.time()
+    with conn:
+        conn.execute("UPDATE files SET status='abandoned', updatedAt=? WHERE inFile=?", (now, inFile))
+        conn.execute("UPDATE jobs SET state='failed', updatedAt=? WHERE inFile=? AND state='planned'", (now, inFile))
+
+#Returns [(batchId, outFile),...] of submitted batches whose results haven't been parsed yet
+def inFlightBatches(kind):
+    rows = getConnection().execute("SELECT batchId, outFile FROM files WHERE kind=? AND status IN ('submitted','completed')", (kind,))
+    return rows.fetchall()
+
+#Marks a batch's requests completed (results available, not yet ingested), requests already parsed stay parsed
+def completeBatch(batchId):
+    conn = getConnection(); now = time.time()
+    with conn:
+        conn.execute("UPDATE files SET status='completed', updatedAt=? WHERE batchId=?", (now, batchId))
+        conn.execute("UPDATE jobs SET state='completed', updatedAt=? WHERE inFile=(SELECT inFile FROM files WHERE batchId=?) AND state!='parsed'", (now, batchId))
+
+#Returns the custom ids of a batch whose results were already written (a retrieval cut short resumes after them)
+def parsedIds(batchId):
+    rows = getConnection().execute("SELECT customId FROM jobs WHERE state='parsed' AND inFile=(SELECT inFile FROM files WHERE batchId=?)", (batchId,))
+    return {row[0] for row in rows}
+
+#Marks requests of a batch parsed as soon as their result rows are written
+def markParsed(batchId, customIds):
+    conn = getConnection(); now = time.time()
+    with conn:
+        conn.executemany("UPDATE jobs SET state='parsed', updatedAt=? WHERE inFile=(SELECT inFile FROM files WHERE batchId=?) AND customId=?",
+                         [(now, batchId, c) for c in customIds])
+
+#Marks ingested requests parsed, the rest of the batch failed (eligible to be sent again)
+def finishBatch(batchId, status, parsedIds):
+    conn = getConnection(); now = time.time()
+    inFile = conn.execute("SELECT inFile FROM files WHERE batchId=?", (batchId,)).fetchone()
+    if inFile is None: return #Batch from before the ledger existed
+    with conn:
+        conn.execute("UPDATE files SET status=?, updatedAt=? WHERE inFile=?", ("parsed" if status == "completed" else status, now, inFile[0]))
+        conn.execute("UPDATE jobs SET state='failed', updatedAt=? WHERE inFile=? AND state!='parsed'", (now, inFile[0]))
+        conn.executemany("UPDATE jobs SET state='parsed', updatedAt=? WHERE inFile=? AND customId=?", [(now, inFile[0], c) for c in parsedIds])
+
+#Counts requests per state, e.g. {"parsed": 120, "submitted": 30}
+def stateCounts(kind):
+    rows = getConnection().execute("SELECT state, COUNT(*) FROM jobs WHERE kind=? GROUP BY state", (kind,))
+    return dict(rows.fetchall())
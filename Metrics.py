@@ -0,0 +1,172 @@
+import threading
+import time
+import json
+import math
+import cProfile
+import pstats
+from pathlib import Path
+from collections import deque
+from contextlib import contextmanager
+
+"""
+Process-wide metrics for the scrape and batch pipeline: counters (HTTP status codes, bytes
+downloaded, cache hits, tokens planned/used, $ cost) and timers (fetch latency, parse time,
+batch queueing) with p50/p95/p99 over a bounded window of recent samples. Everything is
+thread-safe and cheap enough to leave on; report() prints a summary, writeJSON()/writePrometheus()
+export a snapshot, and profile() wraps a block in cProfile (or pyinstrument if installed).
+
+@author Victor Gong
+@version 10/18/2026
+"""
+
+jsonFileName = "log/metrics.json"
+promFileName = "log/metrics.prom"
+profileFileName = "log/profile" #.prof (cProfile) or .html (pyinstrument)
+
+ENABLED = True
+MAX_SAMPLES = 20000 #Recent samples kept per timer for percentiles
+PREFIX = "wallscrape_" #Prometheus metric name prefix
+
+_lock = threading.Lock()
+_counters = {} #Format: {(name, labels) -> value}
+_timers = {} #Format: {(name, labels) -> [count, sum, max, deque of recent samples]}
+
+
+def labelKey(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+#Adds value to a counter, e.g. inc("http_responses", status=200)
+def inc(name, value=1, **labels):
+    if not ENABLED: return
+    key = (name, labelKey(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+#Records one sample of a timer/distribution (ms for timers)
+def observe(name, value, **labels):
+    if not ENABLED: return
+    key = (name, labelKey(labels))
+    with _lock:
+        timer = _timers.get(key)
+        if timer is None: timer = _timers[key] = [0, 0.0, value, deque(maxlen=MAX_SAMPLES)]
+        timer[0] += 1; timer[1] += value; timer[2] = max(timer[2], value); timer[3].append(value)
+
+#Times the block in ms, e.g. with Metrics.timer("parse_ms", backend="lxml"): ...
+@contextmanager
+def timer(name, **labels):
+    timeStart = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, (time.perf_counter() - timeStart) * 1000, **labels)
+
+def reset():
+    with _lock:
+        _counters.clear(); _timers.clear()
+
+"""
+=========================================================
+                        EXPORT
+=========================================================
+"""
+
+#Nearest-rank percentile of sorted samples
+def percentile(samples, q):
+    return samples[min(len(samples)-1, max(0, math.ceil(q * len(samples)) - 1))] if samples else 0.0
+
+#Returns {"counters": [{name, labels, value}], "timers": [{name, labels, count, sum, max, p50, p95, p99}]}
+def snapshot():
+    with _lock:
+        counters = [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in sorted(_counters.items())]
+        timers = [(name, labels, count, total, peak, sorted(samples)) for (name, labels), (count, total, peak, samples) in sorted(_timers.items())]
+    return {"counters": counters, "timers": [{"name": name, "labels": dict(labels), "count": count, "sum": total, "max": peak,
+                                              "p50": percentile(samples, 0.5), "p95": percentile(samples, 0.95), "p99": percentile(samples, 0.99)}
+                                             for name, labels, count, total, peak, samples in timers]}
+
+def writeJSON(fileName=jsonFileName):
+    Path(fileName).parent.mkdir(parents=True, exist_ok=True)
+    with open(fileName, "w") as f:
+        json.dump(dict(snapshot(), time=time.time()), f, indent=1)
+
+def promLabels(labels, extra=None):
+    items = list(labels.items()) + (list(extra.items()) if extra else [])
+    if not items: return ""
+    return "{" + ",".join(k + '="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"' for k, v in items) + "}"
+
+#Prometheus text exposition format (counters as *_total, timers as summaries)
+def toPrometheus():
+    snap = snapshot(); lines = []; typed = set()
+    for c in snap["counters"]:
+        name = PREFIX + c["name"] + "_total"
+        if name not in typed: lines.append("# TYPE " + name + " counter"); typed.add(name)
+        lines.append(name + promLabels(c["labels"]) + " " + repr(float(c["value"])))
+    for t in snap["timers"]:
+        name = PREFIX + t["name"]
+        if name not in typed: lines.append("# TYPE " + name + " summary"); typed.add(name)
+        for q in ("0.5", "0.95", "0.99"):
+            lines.append(name + promLabels(t["labels"], {"quantile": q}) + " " + repr(float(t["p" + q[2:].ljust(2, "0")])))
+        lines.append(name + "_sum" + promLabels(t["labels"]) + " " + repr(float(t["sum"])))
+        lines.append(name + "_count" + promLabels(t["labels"]) + " " + str(t["count"]))
+    return "\n".join(lines) + "\n"
+
+def writePrometheus(fileName=promFileName):
+    Path(fileName).parent.mkdir(parents=True, exist_ok=True)
+    with open(fileName, "w") as f:
+        f.write(toPrometheus())
+
+#Sum of a counter over all label values matching the given ones
+def total(name, **labels):
+    want = set(labelKey(labels))
+    with _lock:
+        return sum(value for (n, l), value in _counters.items() if n == name and want <= set(l))
+
+#Prints a human-readable summary: where the time went (network, parsing, batch queueing) and what it cost
+def report():
+    snap = snapshot()
+    print("===== Metrics =====")
+    for t in snap["timers"]:
+        labels = " ".join(k + "=" + v for k, v in t["labels"].items())
+        print(t["name"].ljust(16), labels.ljust(22), "| n", str(t["count"]).ljust(6), "| p50", round(t["p50"], 1), "| p95", round(t["p95"], 1),
+              "| p99", round(t["p99"], 1), "| max", round(t["max"], 1))
+    statuses = {c["labels"]["status"]: c["value"] for c in snap["counters"] if c["name"] == "http_responses"}
+    if statuses: print("HTTP status:", ", ".join(s + ": " + str(n) for s, n in sorted(statuses.items())), "| downloaded", round(total("bytes_downloaded")/1e6, 2), "MB")
+    lookups = total("cache_lookups")
+    if lookups: print("HTTP cache hit rate:", round((total("cache_lookups", result="hit") + total("cache_lookups", result="revalidated"))/lookups*100, 1), "% of", int(lookups), "GETs")
+    if total("tokens_planned"):
+        print("Tokens planned:", int(total("tokens_planned")), "| actual in:", int(total("tokens_in")), "| actual out:", int(total("tokens_out")))
+        print("Cost planned: $" + str(round(total("cost_planned_usd"), 4)), "| actual: $" + str(round(total("cost_usd"), 4)))
+
+"""
+=========================================================
+                       PROFILING
+=========================================================
+"""
+
+#Profiles the block with pyinstrument (if installed and asked for) or cProfile, saves to profileFileName and prints the top entries
+@contextmanager
+def profile(fileName=profileFileName, backend="cprofile", top=25):
+    Path(fileName).parent.mkdir(parents=True, exist_ok=True)
+    pyinstrument = None
+    if backend == "pyinstrument":
+        try:
+            import pyinstrument
+        except ImportError:
+            print("Metrics: pyinstrument not installed, profiling with cProfile")
+    if pyinstrument is not None:
+        profiler = pyinstrument.Profiler()
+        profiler.start()
+        try:
+            yield profiler
+        finally:
+            profiler.stop()
+            with open(fileName + ".html", "w") as f: f.write(profiler.output_html())
+            print(profiler.output_text(unicode=False, color=False))
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(fileName + ".prof")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(top)
@@ -0,0 +1,179 @@
+import argparse
+import contextlib
+import queue
+import threading
+import time
+import Scheduler
+import Store
+import Analyzer
+import Responses
+import Metrics
+
+"""
+Streaming scrape -> classify -> evaluate runner. Each stage is a thread joined to the next by a
+bounded queue: newly scraped posts flow into the BW (related Y/N) batch builder, and the posts it
+labels Y flow straight into the evaluation batch builder, instead of running every stage by hand
+off files on disk. A batch stage flushes once it has collected FLUSH_SIZE posts or FLUSH_SECONDS
+have passed since the first one arrived; while a stage is busy with a batch its queue fills up and
+blocks the stage feeding it (backpressure), so nothing piles up in memory.
+
+Run with: python Pipeline.py --stock nvidia --target wallstreetbets nvidia [--follow] [--backlog]
+
+@author Victor Gong
+@version 10/18/2026
+"""
+
+QUEUE_SIZE = 2000 #Posts waiting between two stages before the upstream stage blocks
+FLUSH_SIZE = 500 #Posts per BW/eval flush
+FLUSH_SECONDS = 600 #Max seconds a post waits in a stage's buffer before a partial flush
+SCRAPE_INTERVAL = 900 #Seconds between scrape cycles in follow mode
+
+_DONE = None #End-of-stream marker passed down the queues
+
+"""
+=========================================================
+                        STAGES
+=========================================================
+"""
+
+#Scrape stage: stores new posts of the targets and queues the ones tagged with stock; runs once or every
+#interval seconds until stop is set. With backlog, the stock's stored posts are queued first
+#(anything already answered is skipped downstream by the prompt cache / ledger). A failed cycle (Reddit
+#down, rate limited...) is logged and, in follow mode, retried next interval
+def scrapeStage(targets, stock, out, cap, follow, interval, backlog, stop):
+    try:
+        if backlog:
+            for post in Store.loadPosts(ticker=stock):
+                out.put(post)
+        while not stop.is_set():
+            try:
+                tagged = Scheduler.scrapeAndStore(targets, cap, incremental=True)
+            except Exception as e:
+                print("Pipeline: scrape cycle failed:", repr(e))
+                Metrics.inc("pipeline_errors", stage="scrape")
+                tagged = {}
+            for post, tickers in tagged.values():
+                if stock in tickers: out.put(post) #Blocks while the BW stage is behind
+            if not follow or stop.wait(interval): break
+    finally:
+        out.put(_DONE)
+
+#Collects posts from a queue into flushes of up to flushSize, cut short after flushSeconds; yields each flush
+def flushes(inbox, flushSize, flushSeconds):
+    buffer = []; deadline = None
+    while True:
+        try:
+            post = inbox.get(timeout=None if deadline is None else max(0, deadline - time.monotonic()))
+        except queue.Empty:
+            post = False #Time threshold reached
+        if post is _DONE:
+            inbox.put(_DONE) #Left in place for drain() in case the last flush fails
+            if buffer: yield buffer
+            return
+        if post:
+            if not buffer: deadline = time.monotonic() + flushSeconds
+            buffer.append(post)
+        if buffer and (len(buffer) >= flushSize or time.monotonic() >= deadline):
+            yield buffer
+            buffer = []; deadline = None
+
+#BW stage: classifies each flush, queues the posts labelled related for evaluation
+def bwStage(stock, inbox, out, flushSize, flushSeconds, stop):
+    try:
+        for posts in flushes(inbox, flushSize, flushSeconds):
+            print("Pipeline: BW flush of", len(posts), "posts")
+            Analyzer.createBatch_BWAnalysis(posts, stock, confirmMsg=False)
+            related = relatedURLs({post[0] for post in posts}, stock)
+            for post in posts:
+                if post[0] in related: out.put(post) #Blocks while the eval stage is behind
+    except BaseException:
+        stop.set(); drain(inbox) #Unblock and end the scrape stage
+        raise
+    finally:
+        out.put(_DONE)
+
+#Eval stage: scores each flush of related posts
+def evalStage(stock, inbox, flushSize, flushSeconds, stop):
+    try:
+        for posts in flushes(inbox, flushSize, flushSeconds):
+            print("Pipeline: evaluation flush of", len(posts), "posts")
+            Analyzer.createBatch_Eval(posts, stock, confirmMsg=False)
+    except BaseException:
+        stop.set(); drain(inbox) #Unblock and end the BW stage
+        raise
+
+#Discards a failed stage's input up to the end-of-stream marker so the stages feeding it can finish
+def drain(inbox):
+    while inbox.get() is not _DONE: pass
+
+#Returns the URLs among urls that the stock's BW results label related
+def relatedURLs(urls, stock):
+    results = Responses.loadResults(Responses.resultsFileName(Analyzer.BWFileName, stock))
+    return {url for url in urls if url in results and Responses.isRelated([url] + results[url])}
+
+"""
+=========================================================
+                        RUNNER
+=========================================================
+"""
+
+#Runs the pipeline for one stock over (subreddit, query, ticker) targets until the scrape stage ends and both
+#batch stages drain (follow mode runs until Ctrl+C, then drains what was already scraped; a second Ctrl+C
+#abandons the drain, batches already submitted are picked up by the ledger on the next run)
+#If a stage fails, the others are stopped and drained and its exception is raised once they're done
+def runPipeline(targets, stock, cap=300, follow=False, interval=SCRAPE_INTERVAL, backlog=False,
+                flushSize=FLUSH_SIZE, flushSeconds=FLUSH_SECONDS, queueSize=QUEUE_SIZE):
+    toBW = queue.Queue(maxsize=queueSize); toEval = queue.Queue(maxsize=queueSize)
+    stop = threading.Event(); failures = [] #Format: [(stage name, exception),...] in the order they failed
+    stages = [
+        threading.Thread(target=runStage, args=(scrapeStage, (targets, stock, toBW, cap, follow, interval, backlog, stop), failures, stop), name="scrape", daemon=True),
+        threading.Thread(target=runStage, args=(bwStage, (stock, toBW, toEval, flushSize, flushSeconds, stop), failures, stop), name="bw", daemon=True),
+        threading.Thread(target=runStage, args=(evalStage, (stock, toEval, flushSize, flushSeconds, stop), failures, stop), name="eval", daemon=True),
+    ]
+    for stage in stages: stage.start()
+    try:
+        try:
+            waitFor(stages)
+        except KeyboardInterrupt:
+            print("Pipeline: stopping scrape, draining queued posts (Ctrl+C again to abort)")
+            stop.set()
+            waitFor(stages)
+        if failures:
+            print("Pipeline: failed |", ", ".join(name + " stage: " + repr(e) for name, e in failures))
+            raise failures[0][1]
+        print("Pipeline: done")
+    except KeyboardInterrupt:
+        print("Pipeline: aborted") #Stage threads are daemons and die with the process
+    finally:
+        Metrics.report(); Metrics.writeJSON(); Metrics.writePrometheus()
+
+#Runs a stage in its thread, recording its exception (and stopping the scrape) instead of letting the thread die silently
+def runStage(stage, args, failures, stop):
+    try:
+        stage(*args)
+    except BaseException as e:
+        failures.append((threading.current_thread().name, e))
+        stop.set()
+
+#Joins the stage threads with a timeout so Ctrl+C reaches the main thread
+def waitFor(stages):
+    while any(stage.is_alive() for stage in stages):
+        for stage in stages: stage.join(timeout=1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape -> BW classify -> evaluate pipeline")
+    parser.add_argument("--stock", required=True, help="target stock, also the ticker tag of the targets to classify")
+    parser.add_argument("--target", nargs=2, action="append", metavar=("SUBREDDIT", "QUERY"), required=True, help="subreddit search to scrape (repeatable)")
+    parser.add_argument("--cap", type=int, default=300, help="max posts per target per scrape cycle")
+    parser.add_argument("--follow", action="store_true", help="keep scraping every --interval seconds until Ctrl+C")
+    parser.add_argument("--interval", type=float, default=SCRAPE_INTERVAL)
+    parser.add_argument("--backlog", action="store_true", help="also push the stock's stored posts through first")
+    parser.add_argument("--flush-size", type=int, default=FLUSH_SIZE)
+    parser.add_argument("--flush-seconds", type=float, default=FLUSH_SECONDS)
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    parser.add_argument("--profile", choices=["cprofile", "pyinstrument"], help="profile the run (saved to " + Metrics.profileFileName + ".prof/.html)")
+    args = parser.parse_args()
+    with Metrics.profile(backend=args.profile) if args.profile else contextlib.nullcontext():
+        runPipeline([(subreddit, query, args.stock) for subreddit, query in args.target], args.stock, args.cap, args.follow, args.interval,
+                    args.backlog, args.flush_size, args.flush_seconds, args.queue_size)
@@ -0,0 +1,116 @@
+from functools import lru_cache
+import hashlib
+import math
+import ujson
+
+"""
+Batch planner for the Batch API. Counts request tokens with the model's real tokenizer (tiktoken,
+cached encoder + memoized counts so the shared system prompt is only encoded once) and splits a
+request list into the fewest batches that fit under the per-batch token, request-count and
+file-size limits. The plan (counts, tokens, predicted cost per batch) is known before anything is sent.
+
+@author Victor Gong
+@version 10/18/2026
+"""
+
+#Tokenizer is optional, falls back to a characters-per-token estimate without it
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+CHARS_PER_TOKEN = 3.5 #Fallback estimate (conservative)
+TOKENS_PER_MESSAGE = 3 #Chat format overhead per message
+TOKENS_PER_REPLY = 3 #Every reply is primed with <|start|>assistant<|message|>
+
+MAX_BATCH_REQUESTS = 50000 #Batch API limits per input file
+MAX_BATCH_BYTES = 200*1024*1024
+
+PRICES = { #Model -> ($ per 1M input tokens, $ per 1M output tokens) at list price
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o-2024-05-13": (5.00, 15.00),
+    "gpt-3.5-turbo-0125": (0.50, 1.50),
+}
+BATCH_DISCOUNT = 0.5 #Batch API bills half the list price
+COUNT_CACHE_SIZE = 65536 #Memoized token counts, keyed by a digest of the text so post bodies aren't kept alive
+
+_counts = {} #(text digest, model) -> tokens
+
+
+#Returns the (cached) tokenizer for a model, None if tiktoken isn't installed or its vocab can't be loaded
+@lru_cache(maxsize=None)
+def getEncoder(model):
+    if tiktoken is None: return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError: #Model newer than the installed tiktoken
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e: #Vocab download failed (offline)
+        print("Tokenizer unavailable, estimating tokens:", e.__class__.__name__)
+        return None
+
+#Counts tokens in a piece of text (memoized, repeated preambles cost nothing after the first call)
+def countTokens(text, model):
+    key = (hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest(), model)
+    tokens = _counts.get(key)
+    if tokens is None:
+        encoder = getEncoder(model)
+        if encoder is None: tokens = math.ceil(len(text)/CHARS_PER_TOKEN)
+        else: tokens = len(encoder.encode(text, disallowed_special=()))
+        if len(_counts) >= COUNT_CACHE_SIZE: _counts.clear() #Bounded, the shared prompts are re-counted once after a reset
+        _counts[key] = tokens
+    return tokens
+
+#Input tokens of one chat completion request body
+def requestTokens(body):
+    return sum(countTokens(m["content"], body["model"]) + TOKENS_PER_MESSAGE for m in body["messages"]) + TOKENS_PER_REPLY
+
+#Size of one request line in the .jsonl input file
+def requestBytes(data):
+    return len(ujson.dumps(data, escape_forward_slashes=False).encode("utf-8")) + 1
+
+#List prices of a model, dated snapshots (e.g. gpt-4.1-nano-2025-04-14 in batch outputs) match their base model
+def modelPrices(model):
+    if model in PRICES: return PRICES[model]
+    base = max((name for name in PRICES if model.startswith(name)), key=len, default="gpt-4.1-nano")
+    return PRICES[base]
+
+#Batch cost in $ for input plus output tokens: predicted with worst-case (max_tokens) output, or actual with billed usage
+def predictCost(model, inTokens, outTokens):
+    inPrice, outPrice = modelPrices(model)
+    return (inTokens*inPrice + outTokens*outPrice) / 1e6 * BATCH_DISCOUNT
+
+"""
+Splits formatted batch requests into batches under maxTokens/maxRequests/maxBytes.
+Batches are contiguous slices so a run can still be resumed from a list index; with exact
+token counts, filling each batch up to the limit in order gives the fewest contiguous batches.
+
+Returns [{"start", "end", "requests", "tokens", "outTokens", "bytes", "cost"},...] (end exclusive)
+"""
+
+def planBatches(dataList, maxTokens, maxRequests=MAX_BATCH_REQUESTS, maxBytes=MAX_BATCH_BYTES):
+    plan = []
+    current = None
+    for i, data in enumerate(dataList):
+        tokens = requestTokens(data["body"]); size = requestBytes(data)
+        outTokens = data["body"].get("max_tokens", 0)
+        if tokens > maxTokens or size > maxBytes:
+            raise ValueError("Request " + data["custom_id"] + " alone exceeds the batch limit")
+        if current is None or current["tokens"]+tokens > maxTokens or current["requests"]+1 > maxRequests or current["bytes"]+size > maxBytes:
+            current = {"start": i, "end": i, "requests": 0, "tokens": 0, "outTokens": 0, "bytes": 0, "model": data["body"]["model"]}
+            plan.append(current)
+        current["end"] = i+1; current["requests"] += 1
+        current["tokens"] += tokens; current["outTokens"] += outTokens; current["bytes"] += size
+    for batch in plan:
+        batch["cost"] = predictCost(batch.pop("model"), batch["tokens"], batch["outTokens"])
+    return plan
+
+#Prints the batch plan before anything is submitted
+def printPlan(plan, label):
+    print("Batch plan for", label + ":", len(plan), "batches,", sum(b["requests"] for b in plan), "requests,",
+          sum(b["tokens"] for b in plan), "input tokens | Predicted cost: $" + str(round(sum(b["cost"] for b in plan), 4)))
+    for n, batch in enumerate(plan):
+        print("  Batch", n, "| requests [" + str(batch["start"]), "-", str(batch["end"]-1) + "] |", batch["requests"], "requests |",
+              batch["tokens"], "tokens |", round(batch["bytes"]/1024, 1), "KB | $" + str(round(batch["cost"], 4)))
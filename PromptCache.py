@@ -0,0 +1,81 @@
+import threading
+import hashlib
+import ujson
+import time
+import Database
+
+"""
+Prompt-result cache for the Batch API. Results are keyed by a hash of exactly what the model sees
+(model, prompt messages, max_tokens), so a post whose title/description hasn't changed since the
+last run is answered from here instead of being sent again. The hash also rides along in each
+request's custom_id (url|hash) so ingestion can fill the cache without extra bookkeeping.
+
+Result rows written before the cache existed carry no hash. The first time a results .csv is seen
+its answers are kept by URL as legacy answers, along with a hash of the post's title/description at
+that time. The first request for such a URL adopts the legacy answer under its current prompt hash
+instead of being sent again, but only if the post's content still hashes the same.
+
+@author Victor Gong
+@version 10/18/2026
+"""
+
+cacheFileName = "results/prompt_cache.sqlite"
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS results (hash TEXT PRIMARY KEY, response TEXT, createdAt REAL)",
+    "CREATE TABLE IF NOT EXISTS legacyAnswers (fileName TEXT, url TEXT, contentHash TEXT, response TEXT, PRIMARY KEY (fileName, url))",
+    "CREATE TABLE IF NOT EXISTS legacySeeded (fileName TEXT PRIMARY KEY, seededAt REAL)",
+    "DROP TABLE IF EXISTS legacy", #Legacy answers seeded without a content hash, reseeded into legacyAnswers
+    "DROP TABLE IF EXISTS seeded",
+)
+
+_local = threading.local()
+
+
+def getConnection():
+    return Database.connect(_local, cacheFileName, SCHEMA)
+
+#Hash of a chat completion request body (only the fields that change the answer)
+def promptHash(body):
+    key = ujson.dumps([body["model"], body["messages"], body.get("max_tokens")], escape_forward_slashes=False, sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+#Hash of a post's content (what a legacy answer was given for)
+def contentHash(title, description):
+    return hashlib.sha256(ujson.dumps([title, description], escape_forward_slashes=False).encode("utf-8")).hexdigest()[:32]
+
+#Returns {hash -> response} for the hashes that are cached
+def getMany(hashes):
+    return dict(Database.selectIn(getConnection(), "SELECT hash, response FROM results WHERE hash IN ({})", hashes))
+
+#Stores [(hash, response),...]
+def putMany(rows):
+    conn = getConnection(); now = time.time()
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO results VALUES (?,?,?)", [(h, response, now) for h, response in rows])
+
+#True once the answers of a results .csv have been recorded as legacy answers
+def isSeeded(fileName):
+    return getConnection().execute("SELECT 1 FROM legacySeeded WHERE fileName=?", (fileName,)).fetchone() is not None
+
+#Records the answers of a results .csv written before the cache existed (call once per file, see isSeeded)
+#Takes in {url -> [response, typed columns...]} (Responses.loadResults) and {url -> content hash}, answers of
+#posts without a content hash aren't kept
+def seedLegacy(fileName, results, contentHashes):
+    conn = getConnection()
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO legacyAnswers VALUES (?,?,?,?)",
+                         [(fileName, url, contentHashes[url], row[0]) for url, row in results.items() if url in contentHashes])
+        conn.execute("INSERT INTO legacySeeded VALUES (?,?)", (fileName, time.time()))
+
+#Caches the legacy answers of [(url, prompt hash, content hash),...] under their prompt hash if the post's content
+#hasn't changed since seeding, returns {prompt hash -> response}; each legacy answer is adopted or dropped once
+def adoptLegacy(fileName, requests):
+    conn = getConnection(); byUrl = {url: (h, content) for url, h, content in requests}
+    rows = Database.selectIn(conn, "SELECT url, contentHash, response FROM legacyAnswers WHERE fileName=? AND url IN ({})", byUrl, (fileName,))
+    adopted = {byUrl[url][0]: response for url, content, response in rows if byUrl[url][1] == content}
+    if adopted: putMany(adopted.items())
+    if rows:
+        with conn: #Stale answers (content edited since) go too
+            conn.executemany("DELETE FROM legacyAnswers WHERE fileName=? AND url=?", [(fileName, row[0]) for row in rows])
+    return adopted
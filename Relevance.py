@@ -0,0 +1,195 @@
+import re
+import csv
+import math
+from pathlib import Path
+from functools import lru_cache
+from collections import Counter
+import numpy as np
+import Store
+import Responses
+
+"""
+Local relevance prefilter for the BW (related Y/N) pass. Obvious cases are decided on the CPU:
+posts naming the stock or its ticker/aliases in the title (or as a $cashtag) are related, and,
+once enough labels exist in the BW results, a small TF-IDF + logistic regression model decides
+the posts it's confident about either way. Only the ambiguous middle is sent to the Batch API.
+
+Locally decided rows are written to the BW results as "Y (local)" / "N (local)" so they read the
+same downstream ("y" in the answer) but are never used as training labels.
+
+@author Victor Gong
+@version 10/18/2026
+"""
+
+#Ticker/alias dictionary, keyed by target stock (lowercase)
+ALIASES = {
+    "nvidia": {"ticker": "nvda", "aliases": ["nvidia", "nvda", "jensen", "huang", "geforce", "cuda", "blackwell", "h100", "h200", "gb200", "dgx"]},
+}
+
+LOCAL_TAG = " (local)" #Suffix of locally decided answers in the results .csv
+
+MIN_TRAINING_LABELS = 200 #Below this many historical labels, only the alias rules decide
+MIN_DOC_FREQ = 2 #Tokens in fewer training posts are dropped from the vocabulary
+MAX_VOCAB = 50000
+CONFIDENT_YES = 0.9 #Model probability at/above which a post is related without asking
+CONFIDENT_NO = 0.1 #Model probability at/below which a post is unrelated without asking
+EPOCHS = 300 #Full-batch gradient descent steps
+LEARNING_RATE = 0.5
+L2 = 1e-4
+
+_model = {} #Format: {stock -> (vocab, idf, weights, bias)}, trained once per run
+
+"""
+=========================================================
+                     ALIAS RULES
+=========================================================
+"""
+
+#Compiled alias/cashtag patterns for a stock: (any alias as a whole word, $TICKER)
+@lru_cache(maxsize=None)
+def aliasPatterns(stock):
+    entry = ALIASES.get(stock.lower(), {"ticker": stock.lower(), "aliases": [stock.lower()]})
+    aliases = sorted(set(entry["aliases"]) | {stock.lower()}, key=len, reverse=True)
+    aliasRegex = re.compile(r"(?<![a-z0-9])(?:" + "|".join(map(re.escape, aliases)) + r")(?![a-z0-9])", re.IGNORECASE)
+    cashtagRegex = re.compile(r"\$" + re.escape(entry["ticker"]) + r"(?![a-z0-9])", re.IGNORECASE)
+    return aliasRegex, cashtagRegex
+
+#Rule decision: "Y" if the title names the stock or the post uses its $cashtag, else None (undecided)
+def ruleDecision(title, description, stock):
+    aliasRegex, cashtagRegex = aliasPatterns(stock)
+    if aliasRegex.search(title) or cashtagRegex.search(title) or cashtagRegex.search(description): return "Y"
+    return None
+
+"""
+=========================================================
+                  TF-IDF + LINEAR MODEL
+=========================================================
+"""
+
+#Lowercase word tokens (NLTK punkt if downloaded, regex tokenizer otherwise)
+def tokenize(text):
+    import nltk #Imported on first use, it's slow to load and only the model path needs it
+    text = text.lower()
+    try:
+        tokens = nltk.word_tokenize(text)
+    except LookupError: #punkt not downloaded (see the download block in Analyzer.py)
+        tokens = nltk.wordpunct_tokenize(text)
+    return [token for token in tokens if any(c.isalnum() for c in token)]
+
+#Builds the vocabulary {token -> column} and idf weights from tokenized training posts
+def fitVocab(docs):
+    docFreq = Counter(token for doc in docs for token in set(doc))
+    common = [token for token, df in docFreq.most_common(MAX_VOCAB) if df >= MIN_DOC_FREQ]
+    vocab = {token: i for i, token in enumerate(common)}
+    idf = np.array([math.log((1 + len(docs)) / (1 + docFreq[token])) + 1 for token in common])
+    return vocab, idf
+
+#L2-normalized TF-IDF matrix in coordinate form (rows, cols, values, row count); posts x vocab is far too big dense
+def tfidfMatrix(docs, vocab, idf):
+    rows = []; cols = []; values = []
+    for i, doc in enumerate(docs):
+        for token, count in Counter(doc).items():
+            if token in vocab: rows.append(i); cols.append(vocab[token]); values.append(count)
+    rows = np.array(rows, dtype=np.intp); cols = np.array(cols, dtype=np.intp)
+    values = np.array(values, dtype=float) * idf[cols]
+    norms = np.sqrt(np.bincount(rows, weights=values**2, minlength=len(docs)))
+    return rows, cols, values / np.where(norms == 0, 1, norms)[rows], len(docs)
+
+#Trains an L2-regularized logistic regression with full-batch gradient descent, returns (weights, bias)
+def fitLogistic(matrix, labels, vocabSize):
+    rows, cols, values, count = matrix
+    weights = np.zeros(vocabSize); bias = 0.0
+    for _ in range(EPOCHS):
+        error = predictProba(matrix, weights, bias) - labels
+        weights -= LEARNING_RATE * (np.bincount(cols, weights=values*error[rows], minlength=vocabSize) / count + L2 * weights)
+        bias -= LEARNING_RATE * error.mean()
+    return weights, bias
+
+def predictProba(matrix, weights, bias):
+    rows, cols, values, count = matrix
+    return 1 / (1 + np.exp(-(np.bincount(rows, weights=values*weights[cols], minlength=count) + bias)))
+
+#Reads the historical BW labels as [(title, description, 1/0),...] (API answers only, local decisions skipped)
+def loadLabels(bwFileName):
+    if not Path(bwFileName).exists(): return []
+    with open(bwFileName, "r") as csvF:
+        answers = {row[0]: int(Responses.isRelated(row)) for row in csv.reader(csvF) if len(row) >= 2 and not row[1].endswith(LOCAL_TAG)}
+    posts = Store.getPosts(answers, ("title", "description"))
+    return [(title, description, answers[url]) for url, (title, description) in posts.items()]
+
+#Fits the model on labeled posts, returns (vocab, idf, weights, bias)
+def trainModel(labeled):
+    docs = [tokenize(title + " " + description) for title, description, label in labeled]
+    vocab, idf = fitVocab(docs)
+    weights, bias = fitLogistic(tfidfMatrix(docs, vocab, idf), np.array([label for _, _, label in labeled], dtype=float), len(vocab))
+    return vocab, idf, weights, bias
+
+#Returns the stock's model trained on the BW results, or None if there aren't enough labels yet
+def getModel(stock, bwFileName):
+    if stock not in _model:
+        labeled = loadLabels(bwFileName)
+        _model[stock] = trainModel(labeled) if len(labeled) >= MIN_TRAINING_LABELS and len({l for _, _, l in labeled}) == 2 else None
+    return _model[stock]
+
+"""
+=========================================================
+                       PREFILTER
+=========================================================
+"""
+
+#Decides posts locally where possible, returns ({url -> "Y"/"N"}, posts left for the API)
+#Takes in table in the format [(url, title, description, ts, karma, comments, user),...]
+def classifyLocally(posts, stock, model):
+    decided = {}; undecided = []
+    for post in posts:
+        answer = ruleDecision(post[1], post[2], stock)
+        if answer: decided[post[0]] = answer
+        else: undecided.append(post)
+    if model is None or not undecided: return decided, undecided
+
+    vocab, idf, weights, bias = model
+    probs = predictProba(tfidfMatrix([tokenize(post[1] + " " + post[2]) for post in undecided], vocab, idf), weights, bias)
+    ambiguous = []
+    for post, prob in zip(undecided, probs):
+        if prob >= CONFIDENT_YES: decided[post[0]] = "Y"
+        elif prob <= CONFIDENT_NO: decided[post[0]] = "N"
+        else: ambiguous.append(post)
+    return decided, ambiguous
+
+#Prefilters posts for the BW pass: writes local decisions (for posts not already answered) to the BW results .csv
+#Returns the posts that still need the API
+def prefilter(posts, stock, bwFileName):
+    posts = list(posts)
+    decided, ambiguous = classifyLocally(posts, stock, getModel(stock, bwFileName))
+    known = Responses.loadResults(bwFileName)
+    with Responses.appendResults(bwFileName) as csvF:
+        csvWriter = csv.writer(csvF)
+        for url, answer in decided.items():
+            if url not in known: csvWriter.writerow(Responses.resultRow("bw", url, answer + LOCAL_TAG))
+    yes = sum(answer == "Y" for answer in decided.values())
+    print("Relevance prefilter:", len(posts), "posts |", yes, "related and", len(decided)-yes, "unrelated decided locally |", len(ambiguous), "sent to the API")
+    return ambiguous
+
+#Precision/recall of the local decisions against the historical API labels (k-fold, model never sees its test fold)
+def reportPrecisionRecall(stock, bwFileName, folds=5):
+    labeled = loadLabels(bwFileName)
+    if not labeled: print("No historical BW labels in", bwFileName); return
+    order = np.random.default_rng(0).permutation(len(labeled))
+    counts = Counter() #Format: {(decision, truth) -> count}
+    for k in range(folds):
+        testIndices = set(order[k::folds].tolist())
+        test = [labeled[i] for i in order[k::folds]]
+        train = [labeled[i] for i in order if i not in testIndices]
+        model = trainModel(train) if len(train) >= MIN_TRAINING_LABELS and len({l for _, _, l in train}) == 2 else None
+        posts = [(str(i), title, description) for i, (title, description, label) in enumerate(test)]
+        decided, ambiguous = classifyLocally(posts, stock, model)
+        for i, (title, description, label) in enumerate(test):
+            counts[(decided.get(str(i), "?"), label)] += 1
+
+    def ratio(num, den): return round(num/den, 3) if den else float("nan")
+    positives = counts[("Y", 1)] + counts[("N", 1)] + counts[("?", 1)]
+    negatives = counts[("Y", 0)] + counts[("N", 0)] + counts[("?", 0)]
+    print("Relevance prefilter vs", len(labeled), "historical labels (" + str(folds) + "-fold):")
+    print("  Local Y | precision", ratio(counts[("Y", 1)], counts[("Y", 1)] + counts[("Y", 0)]), "| recall", ratio(counts[("Y", 1)], positives))
+    print("  Local N | precision", ratio(counts[("N", 0)], counts[("N", 0)] + counts[("N", 1)]), "| recall", ratio(counts[("N", 0)], negatives))
+    print("  Decided locally:", ratio(len(labeled) - counts[("?", 1)] - counts[("?", 0)], len(labeled)), "of posts (the rest go to the API)")
@@ -0,0 +1,138 @@
+import re
+import io
+import os
+import csv
+import threading
+import ujson
+from pathlib import Path
+
+"""
+Parses model answers into typed result columns once, at ingestion. Eval answers are expected as
+"number | 1-word justification" but come back with decimals, markdown, "Score:" prefixes, other
+separators or trailing sentences; BW answers as Y/N. Result .csv rows keep the raw answer and add
+the typed columns after it:
+
+   BW:   url, response, related ("Y"/"N", empty if unparseable)
+   Eval: url, response, score (float in [-100, 100], empty if unparseable), justification, parsed (1/0)
+
+Scores a little past the scale (e.g. 105) are clamped to it; numbers far outside it ("2024 was a
+great year") aren't scores at all and count as unparseable.
+
+Rows written before the typed columns existed have only (url, response); readers fall back to
+parsing the response for those. Results are kept per stock (a post can be related to one stock and
+not another): RESULTS_STOCK keeps the original file names, other stocks get their own files, e.g.
+results/post_bw_amd.csv. Packed answers (a JSON list of {id, related, score} for several
+posts) are split back into per-post answers in the same formats.
+
+@author Victor Gong
+@version 10/18/2026
+"""
+
+BW_COLUMNS = ("url", "response", "related")
+EVAL_COLUMNS = ("url", "response", "score", "justification", "parsed")
+
+RESULTS_STOCK = "nvidia" #Stock of the results files written before results were kept per stock
+
+_results = {} #Format: {absolute file name -> (file id, bytes read, {url -> [response, typed columns...]})}, see loadResults
+_resultsLock = threading.Lock()
+
+SCORE_MIN = -100.0
+SCORE_MAX = 100.0
+SCORE_TOLERANCE = 10.0 #How far past the scale a score is still clamped instead of rejected
+
+#Leading number (optionally "Score:"-prefixed, "/100"-suffixed, wrapped in markdown/quotes), then an optional separator and first word
+EVAL_REGEX = re.compile(r"""^[\s*"'`]*(?:score\s*[:=]?\s*)?([-+−]?(?:\d+(?:\.\d*)?|\.\d+))\s*(?:/\s*100)?[\s*"'`]*"""
+                        r"""(?:[|:,;–—-]+[\s*"'`]*([^\s|*"'`.,;:!?]+))?""", re.IGNORECASE)
+#Y/yes/N/no as a whole token: followed by whitespace, punctuation other than "/" (N/A isn't N) or the end
+BW_REGEX = re.compile(r"""^[\s*"'`(]*(y(?:es)?|n(?:o)?)(?=$|[^\w/])""", re.IGNORECASE)
+
+
+#Returns score clamped to [SCORE_MIN, SCORE_MAX], or None if it's more than SCORE_TOLERANCE outside
+def clampScore(score):
+    if not SCORE_MIN - SCORE_TOLERANCE <= score <= SCORE_MAX + SCORE_TOLERANCE: return None
+    return min(max(score, SCORE_MIN), SCORE_MAX)
+
+#Returns (score, justification, parsed) of an eval answer, score is None if there's no leading number (or it's off the scale)
+def parseEval(content):
+    head, sep, tail = content.partition(" | ")
+    if sep and tail.isalpha() and head.isascii() and (head[1:] if head[:1] in "-+" else head).replace(".", "", 1).isdigit(): #Fast path for the exact requested format (isdigit alone passes "5²")
+        score = clampScore(float(head))
+        return (score, tail, 1) if score is not None else (None, "", 0)
+    match = EVAL_REGEX.match(content)
+    if match is None: return None, "", 0
+    score = clampScore(float(match.group(1).replace("−", "-")))
+    return (score, match.group(2) or "", 1) if score is not None else (None, "", 0)
+
+#Returns "Y"/"N" for a BW answer, "" if it's neither
+def parseBW(content):
+    match = BW_REGEX.match(content)
+    return match.group(1)[0].upper() if match else ""
+
+#Returns {id -> (related "Y"/"N"/"", score or None)} of a packed answer, a JSON array or {"posts": [...]}
+#(markdown fences and text around the JSON are ignored), empty if it isn't valid JSON
+def parsePacked(content):
+    start = min((i for i in (content.find("["), content.find("{")) if i >= 0), default=-1)
+    end = max(content.rfind("]"), content.rfind("}"))
+    try:
+        answers = ujson.loads(content[start:end+1]) if start >= 0 else None
+    except ValueError:
+        return {}
+    if isinstance(answers, dict): answers = answers.get("posts")
+    parsed = {}
+    for answer in answers if isinstance(answers, list) else []:
+        if not isinstance(answer, dict): continue
+        try:
+            postId = int(answer.get("id"))
+        except (TypeError, ValueError):
+            continue
+        try:
+            score = clampScore(float(answer.get("score")))
+        except (TypeError, ValueError):
+            score = None
+        parsed[postId] = (parseBW(str(answer.get("related", ""))), score)
+    return parsed
+
+#Builds the results .csv row for an answer: the raw answer plus the typed columns of its kind ("bw"/"eval")
+def resultRow(kind, url, response):
+    if kind == "bw": return [url, response, parseBW(response)]
+    if kind == "eval":
+        score, justification, parsed = parseEval(response)
+        return [url, response, "" if score is None else "%g" % score, justification, parsed]
+    return [url, response]
+
+#True if a BW results row says the post is related (typed column, or the raw answer for legacy rows)
+def isRelated(row):
+    return (row[2] if len(row) > 2 else parseBW(row[1])) == "Y"
+
+#Opens a results .csv for appending rows, creating its directory first (results/ isn't part of a checkout)
+def appendResults(fileName):
+    Path(fileName).parent.mkdir(parents=True, exist_ok=True)
+    return open(fileName, "a")
+
+#Returns the results .csv of stock: fileName itself for RESULTS_STOCK, fileName with the stock appended for others
+def resultsFileName(fileName, stock):
+    stock = re.sub(r"\W+", "_", stock.strip().lower())
+    if stock == RESULTS_STOCK: return fileName
+    path = Path(fileName)
+    return str(path.with_name(path.stem + "_" + stock + path.suffix))
+
+#Returns {url -> [response, typed columns...]} of a results .csv (the last row of each URL), empty if there's none yet
+#The rows stay in memory between calls and only rows appended since the last call are read, so checking a flush of
+#posts against the results doesn't re-read the whole file every time. Don't modify the returned dict
+def loadResults(fileName):
+    key = os.path.abspath(fileName)
+    with _resultsLock:
+        try:
+            with open(fileName, "rb") as f:
+                stat = os.fstat(f.fileno()); fileId = (stat.st_dev, stat.st_ino)
+                cachedId, offset, rows = _results.get(key, (None, 0, {}))
+                if cachedId != fileId or stat.st_size < offset: offset, rows = 0, {} #New, replaced or truncated file
+                f.seek(offset); data = f.read()
+        except FileNotFoundError:
+            _results.pop(key, None)
+            return {}
+        data = data[:data.rfind(b"\n") + 1] #Whole rows only, a row still being written is read next time
+        for row in csv.reader(io.StringIO(data.decode("utf-8"), newline="")):
+            if len(row) >= 2: rows[row[0]] = row[1:]
+        _results[key] = (fileId, offset + len(data), rows)
+        return rows
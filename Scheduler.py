@@ -0,0 +1,105 @@
+from concurrent.futures import ThreadPoolExecutor
+import Scraper
+import Tracker
+import Store
+
+"""
+Multi-ticker, multi-subreddit scrape scheduler. Crawls every (subreddit, query, ticker) target's
+listing concurrently through Scraper's shared fetch pool (one rate-limit budget for all targets),
+dedupes posts that show up under several targets so each is processed once, and tags every post
+with all the tickers it matched before storing them (per-ticker views via Store.loadPosts(ticker=...)).
+
+@author Victor Gong
+@version 10/18/2026
+"""
+
+
+#Crawls one target's listing, returns its raw listing entries (stops at known posts and skips seen ones if an index entry is given)
+def crawlTarget(target, cap, entry=None):
+    subreddit, query, ticker = target
+    if entry is None: return list(Scraper.walkListing(subreddit, query, cap))
+    return list(Scraper.walkListing(subreddit, query, cap, isKnown=lambda postId, ts: Tracker.isKnown(entry, postId, ts),
+                                    isSeen=lambda postId: Tracker.isSeen(entry, postId)))
+
+#Scrapes all targets, returns {url -> ((url, title, description, ts, karma, comments, user), {tickers})}
+#Incremental crawls update index (Tracker.loadIndex()) in place; the caller saves it once the posts are stored
+def scrapeTargets(targets, cap=300, incremental=True, index=None):
+    if index is None: index = Tracker.loadIndex() if incremental else {}
+    entries = [Tracker.getTarget(index, subreddit, query) if incremental else None for subreddit, query, ticker in targets]
+    for target, entry in zip(targets, entries):
+        if entry is not None and not entry["ids"]: seedFromStore(entry, target[0], target[2])
+
+    with ThreadPoolExecutor(max_workers=Scraper.MAX_WORKERS) as pool:
+        #Listing stage, all targets at once
+        listings = list(pool.map(lambda i: crawlTarget(targets[i], cap, entries[i]), range(len(targets))))
+
+        #Dedupe across targets, a post matching several tickers is kept once with every tag
+        found = {}; tags = {} #Format: {url -> listing data}, {url -> {tickers}}
+        for target, entry, listing in zip(targets, entries, listings):
+            for data in listing:
+                url = "http://reddit.com" + data["permalink"]
+                found.setdefault(url, data)
+                tags.setdefault(url, set()).add(target[2])
+                if entry is not None: Tracker.markSeen(entry, "t3_" + data["id"], Scraper.listingTimestamp(data))
+            if entry is not None and len(listing) < cap: Tracker.markCovered(entry) #Not cut short by the cap
+        #Post stage, one conversion (and detail fetch if the listing lacked it) per unique post
+        urls = list(found.keys())
+        posts = list(pool.map(lambda url: Scraper.listingToPost(found[url]), urls))
+
+    print("Scheduler:", sum(len(l) for l in listings), "listing hits,", len(urls), "unique posts across", len(targets), "targets")
+    return {url: (post, tags[url]) for url, post in zip(urls, posts)}
+
+#Seeds an empty index entry with the ticker's posts already stored from the target's subreddit (first incremental run)
+#A target with none of its own posts stored stays uncovered, so its first crawl fetches its history up to cap
+def seedFromStore(entry, subreddit, ticker):
+    seeded = 0
+    for url, postId, ts in Store.loadPosts(("url", "postId", "ts"), ticker=ticker):
+        if Store.subredditFromURL(url) == subreddit.lower():
+            Tracker.markSeen(entry, postId, ts); seeded += 1
+    if seeded: Tracker.markCovered(entry)
+
+#Fetches fresh karma/comments once for the recent posts of every target that's due, returns {postId -> (karma, comments)}
+#Saves the index unless the caller passes its own (then the caller saves it)
+def refreshTargets(targets, index=None):
+    ownIndex = index is None
+    if ownIndex: index = Tracker.loadIndex()
+    postIds = set()
+    for subreddit, query, ticker in targets:
+        entry = Tracker.getTarget(index, subreddit, query)
+        if Tracker.dueForRefresh(entry):
+            postIds.update(Tracker.recentIds(entry))
+            Tracker.markRefreshed(entry)
+    stats = Scraper.fetchPostStats(sorted(postIds)) if postIds else {}
+    if ownIndex: Tracker.saveIndex(index)
+    return stats
+
+#Upserts tagged posts into the post store and applies refreshed stats
+def writeTickerPosts(tagged, stats=None):
+    posts = [post for post, tickers in tagged.values()]
+    count = Store.upsertPosts(posts, [tickers for post, tickers in tagged.values()])
+    if stats: Store.updateStats(stats)
+    print("Wrote", count, "new/updated posts to", Store.storeFileName)
+
+#Scrapes the targets, stores the tagged posts (and refreshed stats), then saves the seen-post index; the index is
+#only saved once the posts are in the store, so a failed write never leaves posts marked seen but missing
+#Returns the tagged posts like scrapeTargets
+def scrapeAndStore(targets, cap=300, incremental=True):
+    index = Tracker.loadIndex() if incremental else {}
+    tagged = scrapeTargets(targets, cap, incremental, index)
+    writeTickerPosts(tagged, refreshTargets(targets, index) if incremental else {})
+    if incremental: Tracker.saveIndex(index)
+    return tagged
+
+#Streams the comment threads of posts into the store, several threads at once; each worker writes its thread as it
+#streams so memory stays flat for any thread size. Returns # of comments written
+def crawlComments(postIds, maxDepth=Scraper.COMMENT_MAX_DEPTH, maxCount=Scraper.COMMENT_MAX_COUNT):
+    def crawlThread(postId):
+        try:
+            return Store.upsertComments(Scraper.streamComments(postId, maxDepth, maxCount))
+        except Exception as e: #Deleted/locked thread, keep going with the rest
+            print("Comments of", postId, "failed:", e.__class__.__name__)
+            return 0
+    with ThreadPoolExecutor(max_workers=max(1, Scraper.MAX_WORKERS // Scraper.COMMENT_CONCURRENCY)) as pool:
+        count = sum(pool.map(crawlThread, postIds))
+    print("Wrote", count, "comments from", len(postIds), "threads to", Store.storeFileName)
+    return count
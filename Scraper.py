@@ -1,10 +1,25 @@
 from bs4 import BeautifulSoup
 import requests
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, quote_plus
+from datetime import datetime, timezone
+from collections import deque
+import threading
 import time
 import math
+import Cache
+import Metrics
+
+#Optional fast HTML parsers (extraction falls back to BeautifulSoup's html.parser without them)
+try:
+	import lxml.html
+except ImportError:
+	lxml = None
+try:
+	from selectolax.lexbor import LexborHTMLParser as HTMLParser
+except ImportError:
+	HTMLParser = None
 
 """
 Main webscraper for Reddit analysis. Extracts posts, comments, and content from subreddits,
@@ -29,22 +44,123 @@ headers = {
     'Sec-Fetch-Site': 'same-origin',
 }
 
+#Fetch pool settings
+MAX_WORKERS = 8 #Threads fetching post pages at once
+HOST_CONCURRENCY = 4 #Max in-flight requests to a single host
+RATE_LIMIT = 2.0 #Max requests per second across every host (0 to disable)
+MAX_RETRIES = 4 #Retries on throttling/server errors before giving up
+BACKOFF_BASE = 1.0 #Seconds to wait before first retry, doubled every retry (Retry-After header wins if sent)
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+#JSON listing settings
+LISTING_PAGE_SIZE = 100 #Posts per listing page (Reddit max is 100)
+
+#Comment thread settings
+COMMENT_MAX_DEPTH = 8 #Replies nested deeper than this are dropped (0 = top-level comments only)
+COMMENT_MAX_COUNT = 2000 #Max comments streamed per thread
+COMMENT_CONCURRENCY = 4 #"More comments" expansions in flight per thread
+MORECHILDREN_BATCH = 100 #Comment ids per morechildren request (Reddit max is 100)
+
+#HTML extraction settings
+PARSER_BACKEND = "selectolax" #Post page backend: "selectolax", "lxml" or "bs4" (uses the next available if not installed)
+SEARCH_FEATURES = "lxml" if lxml is not None else "html.parser" #BeautifulSoup tree builder for the search page
+
+"""
+=========================================================
+                    HTTP SESSION / POOL
+=========================================================
+"""
+
+#Spaces out requests so the whole process stays under a global requests/second budget
+class RateLimiter:
+	def __init__(self, rate):
+		self.rate = rate
+		self.nextSlot = 0.0
+		self.lock = threading.Lock()
+
+	#Blocks until the caller is allowed to send its request
+	def wait(self):
+		if not self.rate: return
+		with self.lock:
+			now = time.monotonic()
+			slot = max(now, self.nextSlot)
+			self.nextSlot = slot + 1.0/self.rate
+		if slot > now: time.sleep(slot - now)
+
+_session = None
+_sessionLock = threading.Lock()
+_hostLocks = {} #Format: {host -> BoundedSemaphore}
+_rateLimiter = RateLimiter(RATE_LIMIT)
 
+#Returns the shared keep-alive session (one connection pool for every fetch)
+def getSession():
+	global _session
+	with _sessionLock:
+		if _session is None:
+			_session = requests.Session()
+			adapter = HTTPAdapter(pool_connections=HOST_CONCURRENCY, pool_maxsize=max(MAX_WORKERS, HOST_CONCURRENCY))
+			_session.mount("https://", adapter); _session.mount("http://", adapter)
+			_session.headers.update(headers)
+		return _session
 
-#Checks if a page/URL exists
-def urlExists(url):
+#Returns the semaphore capping concurrent requests to a host
+def hostLock(url):
+	host = urlparse(url).netloc
+	with _sessionLock:
+		if host not in _hostLocks: _hostLocks[host] = threading.BoundedSemaphore(HOST_CONCURRENCY)
+		return _hostLocks[host]
+
+#Seconds to wait before retry number `attempt` (0-based), honouring Retry-After when the server sends one
+def retryDelay(response, attempt):
+	if response is not None and "Retry-After" in response.headers:
+		try:
+			return float(response.headers["Retry-After"])
+		except ValueError:
+			pass
+	return BACKOFF_BASE * (2**attempt)
+
+#Sends a request, GETs go through the on-disk response cache (see Cache.py) when it's enabled
+def fetch(url, method="GET", **kwargs):
 	url = url.replace("http://","https://")
+	if method == "GET" and Cache.ENABLED:
+		return Cache.fetchCached(url, lambda extraHeaders: fetchNetwork(url, method, headers=extraHeaders, **kwargs))
+	return fetchNetwork(url, method, **kwargs)
+
+#Sends a request through the shared session with per-host concurrency, global rate limit and retry/backoff on 429/5xx
+def fetchNetwork(url, method="GET", **kwargs):
+	kwargs.setdefault("timeout", 20)
+	with hostLock(url):
+		for attempt in range(MAX_RETRIES+1):
+			_rateLimiter.wait()
+			timeStart = time.perf_counter()
+			try:
+				response = getSession().request(method, url, **kwargs)
+			except requests.RequestException:
+				Metrics.inc("http_responses", status="error")
+				if attempt == MAX_RETRIES: raise
+				time.sleep(retryDelay(None, attempt)); continue
+			Metrics.observe("fetch_ms", (time.perf_counter()-timeStart)*1000, method=method) #Body included (not streamed)
+			Metrics.inc("http_responses", status=response.status_code)
+			Metrics.inc("bytes_downloaded", len(response.content))
+			if response.status_code in RETRY_STATUS and attempt < MAX_RETRIES:
+				Metrics.inc("http_retries")
+				time.sleep(retryDelay(response, attempt)); continue
+			return response
+
+
+
+#Downloads a post page once, returns its HTML or None if the post doesn't exist
+#(404/410, other error codes, or a redirect away from the post e.g. to the subreddit or login page)
+def fetchPost(url):
 	try:
-		check = requests.head(url, headers=headers); requests.get(url, headers=headers)
-		return check.status_code >= 200 and check.status_code < 400
-	except Exception as e:
-		return False
-	
-#Extracts page source HTML from URL and creates BeautifulSoup instance
-def createSoup(url):
-	html = requests.get(url, headers=headers).text
-	soup = BeautifulSoup(html, features="html.parser")
-	return soup
+		response = fetch(url, allow_redirects=True)
+	except Exception:
+		return None
+	if not (200 <= response.status_code < 400): #404/410 for deleted posts, anything else left after retries
+		return None
+	if "/comments/" not in urlparse(response.url).path: #Removed/deleted posts redirect elsewhere
+		return None
+	return response.text
 
 #Checks if HTML element has attribute that begins with a prefix
 def elementHasLabelPrefix(ele, attr, prefix):
@@ -52,12 +168,6 @@ def elementHasLabelPrefix(ele, attr, prefix):
 		if isinstance(ele[attr], list): return ele[attr][0].startswith(prefix)
 		return ele[attr].startswith(prefix)
 
-#Checks if HTML element has attribute that includes a substring
-def elementHasLabelSub(ele, attr, sub):
-	if ele and ele.has_attr(attr):
-		if isinstance(ele[attr], list): return sub in ele[attr][0]
-		return sub in ele[attr]
-
 
 """
 Scrape posts off subreddit search by targetting:
@@ -71,6 +181,8 @@ Returns list of (post URL, post title, description, timestamp, karma, # of comme
 """
 
 def extractPosts(subURL, scroll=5, cap=30):
+	from selenium import webdriver #Browser mode only, the JSON scraper never loads Selenium
+	from selenium.webdriver.common.by import By
 	browser = webdriver.Chrome(); browser.get(subURL)
 	subBody = browser.find_element(By.TAG_NAME, "body")
 
@@ -83,52 +195,224 @@ def extractPosts(subURL, scroll=5, cap=30):
 	
 	#Extract post URLs from source HTML
 	subHTML = browser.page_source; browser.close()
-	soup = BeautifulSoup(subHTML, features="html.parser")
-	postEle = soup.find_all("a",{"data-testid":"post-title-text"})
-	posts = []
+	cells = extractSearchCells(subHTML, subURL, cap)
+
+	#Fetch post pages concurrently (results keep search order)
 	timeOrigin = time.time() #Time profiling (average)
+	with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+		posts = [p for p in pool.map(lambda cell: fetchPostCell(*cell), cells) if p]
+	avgTime = str(round((time.time()-timeOrigin)*1000/len(posts), 1)) + " ms/post" if posts else "n/a"
+	print("PostScrape: extracted",len(posts),"posts from",subURL, "| Avg. " + avgTime)
+	return posts
+
+#Reads the search cells of a loaded search page's HTML, returns [(url, ts, karma, comments),...] (up to cap)
+def extractSearchCells(subHTML, subURL, cap=30):
+	subPrefix = "/" + "/".join(urlparse(subURL).path.strip("/").split("/")[:2]) + "/" #e.g. /r/wallstreetbets/
+	soup = BeautifulSoup(subHTML, features=SEARCH_FEATURES)
+	postEle = soup.find_all("a",{"data-testid":"post-title-text"})
+	cells = [] #Format: [(url, ts, karma, comments),...]
 	for p in postEle:
 		if not cap: break
 		mainEle = p.parent #<div> that contains all information for this search cell
-		if elementHasLabelPrefix(p, "href", "/r/wallstreetbets/") and mainEle:
+		if elementHasLabelPrefix(p, "href", subPrefix) and mainEle:
 			url = "http://reddit.com" + p["href"]
-			if urlExists(url):
-				timeStart = time.time() #Time profiling (per post)
-
-				#Title, description, user
-				title, description, user = getPostExtraDetails(url)
-
-				#Timestamp
-				ts = ""
-				tsEle = mainEle.find("faceplate-timeago")
-				if tsEle and tsEle.has_attr("ts"): ts = tsEle["ts"]
-
-				#Karma and # of comments
-				karma = 0; comments = 0
-				fpEle = mainEle.find_all("faceplate-number")
-				for fp in fpEle:
-					if fp and fp.has_attr("number") and fp.parent:
-						labelIn = "" #Can either be in a <span> inside
-						if fp.parent.find("span"): labelIn = fp.parent.find("span").text
-						labelOut = fp.parent.text #Or in the <span> outside
-						if "votes" in (labelIn+labelOut):
-							karma = int(fp["number"]) 
-						elif "comments" in (labelIn+labelOut):
-							comments = int(fp["number"])
-				
-				posts.append((url, title, description, ts, karma, comments, user))
-				print(url, title, ts, user, karma, comments, "| " + str(round((time.time()-timeStart)*1000)) + " ms")
+			ts, karma, comments = getSearchCellDetails(mainEle)
+			cells.append((url, ts, karma, comments))
 			cap-=1
-	print("PostScrape: extracted",len(posts),"posts from",subURL, "| Avg. " + str(round((time.time()-timeOrigin)*1000/len(posts), 1)) + " ms/post")
-	return posts
+	return cells
+
+#Reads timestamp, karma and # of comments from a search cell
+def getSearchCellDetails(mainEle):
+	#Timestamp
+	ts = ""
+	tsEle = mainEle.find("faceplate-timeago")
+	if tsEle and tsEle.has_attr("ts"): ts = tsEle["ts"]
+
+	#Karma and # of comments
+	karma = 0; comments = 0
+	fpEle = mainEle.find_all("faceplate-number")
+	for fp in fpEle:
+		if fp and fp.has_attr("number") and fp.parent:
+			labelIn = "" #Can either be in a <span> inside
+			if fp.parent.find("span"): labelIn = fp.parent.find("span").text
+			labelOut = fp.parent.text #Or in the <span> outside
+			if "votes" in (labelIn+labelOut):
+				karma = int(fp["number"]) 
+			elif "comments" in (labelIn+labelOut):
+				comments = int(fp["number"])
+	return ts, karma, comments
+
+#Fetches one post page (run on the fetch pool), returns the post tuple or None if the post is gone
+def fetchPostCell(url, ts, karma, comments):
+	timeStart = time.perf_counter() #Time profiling (per post, fetch + parse)
+	html = fetchPost(url) #One download serves both the existence check and the detail parse
+	if html is None: return None
+
+	#Title, description, user
+	title, description, user = getPostExtraDetails(url, html)
+	postTime = (time.perf_counter()-timeStart)*1000
+	Metrics.observe("post_ms", postTime)
+	print(url, title, ts, user, karma, comments, "| " + str(round(postTime)) + " ms")
+	return (url, title, description, ts, karma, comments, user)
+
+"""
+Scrape posts off subreddit search through Reddit's JSON listing endpoint (no browser):
+Walks search.json pages with the `after` cursor until `cap` posts are collected. Listings
+already carry title, selftext, author, score and comment count, so post pages are only
+fetched for the rare entries missing them.
+
+fetchPage(url) -> parsed JSON can be swapped out to replay recorded listing responses.
+isKnown(postId, ts) -> bool stops the crawl at the first post of known territory (incremental mode, sort=new).
+isSeen(postId) -> bool skips posts already scraped without counting them towards cap (filling a gap left by a capped crawl).
+
+Yields (post URL, post title, description, timestamp, karma, # of comments, and user)
+"""
+
+def extractPostsJSON(subreddit, query, cap=30, sort="new", fetchPage=None, isKnown=None, isSeen=None):
+	for data in walkListing(subreddit, query, cap, sort, fetchPage, isKnown, isSeen):
+		yield listingToPost(data)
+
+#Yields raw listing entries (the "data" of each t3 child) page by page
+def walkListing(subreddit, query, cap=30, sort="new", fetchPage=None, isKnown=None, isSeen=None):
+	fetchPage = fetchPage or fetchListing
+	after = None
+	while cap:
+		listing = fetchPage(listingURL(subreddit, query, sort, after, min(cap, LISTING_PAGE_SIZE)))["data"]
+		for child in listing["children"]:
+			if not cap: break
+			if child["kind"] != "t3": continue
+			data = child["data"]
+			if isKnown and isKnown("t3_" + data["id"], listingTimestamp(data)): return #Reached known territory
+			if isSeen and isSeen("t3_" + data["id"]): continue #Scraped by an earlier, capped crawl
+			yield data
+			cap-=1
+		after = listing.get("after")
+		if not after: break
+
+#Builds the search.json URL for one listing page
+def listingURL(subreddit, query, sort="new", after=None, limit=LISTING_PAGE_SIZE):
+	url = "https://www.reddit.com/r/"+subreddit+"/search.json?q="+quote_plus(query)+"&restrict_sr=1&type=link&sort="+sort+"&limit="+str(limit)+"&raw_json=1"
+	if after: url += "&after="+after
+	return url
+
+#Downloads one listing page and decodes it
+def fetchListing(url):
+	response = fetch(url)
+	response.raise_for_status()
+	return response.json()
+
+#Formats a listing entry's creation time like faceplate-timeago's ts (e.g. 2024-12-17T20:19:17.364000+0000)
+def listingTimestamp(data):
+	return datetime.fromtimestamp(data["created_utc"], timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f+0000")
+
+#Converts a listing entry to the post tuple (same field formats as the HTML scraper)
+def listingToPost(data):
+	url = "http://reddit.com" + data["permalink"]
+	ts = listingTimestamp(data)
+	karma = int(data.get("score", 0)); comments = int(data.get("num_comments", 0))
+	if "selftext" in data and "author" in data:
+		title = data["title"]
+		description = "".join(p.strip() + " " for p in data["selftext"].split("\n\n") if p.strip()) #Paragraphs like the <p> join
+		user = "/user/" + data["author"] + "/"
+	else: #Listing entry is missing body/author, fall back to the post page
+		title, description, user = getPostExtraDetails(url)
+	return (url, title, description, ts, karma, comments, user)
+
+#Fetches current karma and # of comments for post ids (100 per request), returns {postId -> (karma, comments)}
+def fetchPostStats(postIds, fetchPage=None):
+	fetchPage = fetchPage or fetchListing
+	stats = {}
+	for i in range(0, len(postIds), LISTING_PAGE_SIZE):
+		listing = fetchPage("https://www.reddit.com/by_id/" + ",".join(postIds[i:i+LISTING_PAGE_SIZE]) + ".json?raw_json=1")["data"]
+		for child in listing["children"]:
+			data = child["data"]
+			stats[data["name"]] = (int(data.get("score", 0)), int(data.get("num_comments", 0)))
+	return stats
+
+"""
+Stream a post's comment thread through Reddit's JSON endpoints (no HTML trees):
+The thread's first page comes from /comments/<id>.json; collapsed "more comments" stubs are expanded
+with /api/morechildren (up to COMMENT_CONCURRENCY requests in flight), walking breadth-first with
+an explicit queue so only the current page and the pending stub ids are ever held in memory.
+Replies deeper than maxDepth and comments past maxCount are skipped.
+
+Yields compact records (post id, comment id, parent id, user, timestamp, karma, text)
+"""
+
+def streamComments(postId, maxDepth=COMMENT_MAX_DEPTH, maxCount=COMMENT_MAX_COUNT, fetchPage=None):
+	fetchPage = fetchPage or fetchListing
+	pending = deque() #Format: [[comment ids],...] of unexpanded "more" stubs, MORECHILDREN_BATCH ids each
+	count = 0
+	thread = fetchPage(threadURL(postId, maxDepth))
+	for record in walkComments(postId, thread[1]["data"]["children"], pending, maxDepth):
+		yield record
+		count+=1
+		if count >= maxCount: return
+	del thread
+
+	with ThreadPoolExecutor(max_workers=COMMENT_CONCURRENCY) as pool:
+		while pending:
+			chunks = [pending.popleft() for _ in range(min(COMMENT_CONCURRENCY, len(pending)))]
+			for things in pool.map(lambda ids: fetchMoreChildren(postId, ids, fetchPage), chunks):
+				for record in walkComments(postId, things, pending, maxDepth):
+					yield record
+					count+=1
+					if count >= maxCount: return
+
+#Builds the thread .json URL of a post id (t3_...), depth capped server-side too
+def threadURL(postId, maxDepth=COMMENT_MAX_DEPTH):
+	return "https://www.reddit.com/comments/" + postId[3:] + ".json?sort=old&limit=500&depth=" + str(maxDepth+1) + "&raw_json=1"
+
+#Fetches collapsed comments by id, returns the flat list of things (t1 comments and further "more" stubs)
+def fetchMoreChildren(postId, ids, fetchPage=None):
+	fetchPage = fetchPage or fetchListing
+	url = "https://www.reddit.com/api/morechildren.json?api_type=json&limit_children=false&raw_json=1&link_id=" + postId + "&children=" + ",".join(ids)
+	return fetchPage(url)["json"]["data"]["things"]
+
+#Yields records of a list of comment things and their nested replies (iterative, depth-first),
+#queueing "more" stubs onto pending in MORECHILDREN_BATCH sized chunks
+def walkComments(postId, children, pending, maxDepth=COMMENT_MAX_DEPTH):
+	stack = list(reversed(children))
+	while stack:
+		child = stack.pop()
+		data = child["data"]
+		if data.get("depth", 0) > maxDepth: continue
+		if child["kind"] == "more":
+			ids = data.get("children") or [] #Empty for "continue this thread" links
+			for i in range(0, len(ids), MORECHILDREN_BATCH): pending.append(ids[i:i+MORECHILDREN_BATCH])
+		elif child["kind"] == "t1":
+			yield commentRecord(postId, data)
+			replies = data.get("replies")
+			if replies: stack.extend(reversed(replies["data"]["children"]))
+
+#Converts a comment's data to (post id, comment id, parent id, user, timestamp, karma, text)
+def commentRecord(postId, data):
+	user = "/user/" + data["author"] + "/" if data.get("author") else ""
+	text = " ".join((data.get("body") or "").split()) #Whitespace collapsed
+	return (postId, data["name"], data.get("parent_id", ""), user, listingTimestamp(data), int(data.get("score") or 0), text)
 
 #Retrieves and returns the title, description, and user
 #**Potential point of improvement, use image-to-text on figures in posts for more content
 
-def getPostExtraDetails(postURL):
-	soup = createSoup(postURL)
+def getPostExtraDetails(postURL, html=None):
+	if html is None: html = fetch(postURL).text
+	return extractPostDetails(html)
+
+#Parses title, description and user out of a post page's HTML with the configured backend
+def extractPostDetails(html, backend=None):
+	backend = backend or PARSER_BACKEND
+	if backend == "selectolax" and HTMLParser is not None: backend, parse = "selectolax", extractPostDetails_selectolax
+	elif backend in ("selectolax", "lxml") and lxml is not None: backend, parse = "lxml", extractPostDetails_lxml
+	else: backend, parse = "bs4", extractPostDetails_bs4
+	with Metrics.timer("parse_ms", backend=backend):
+		return parse(html)
+
+#Reference backend: full BeautifulSoup tree with linear scans
+def extractPostDetails_bs4(html):
+	soup = BeautifulSoup(html, features="html.parser")
 	postId = "" #Every reddit post has a unique id used in the HTML labels (e.g. t3_1hgjsgd), can be found in post title element
 	postEle = soup.find("shreddit-post")
+	if postEle is None: return "", "", "" #Not a post page
 
 	#Get title
 	title = ""
@@ -154,3 +438,51 @@ def getPostExtraDetails(postURL):
 			for text in d.find_all("p"):
 				desc += text.text + " "
 	return title, desc, user
+
+#lxml backend: C parser + targeted XPath instead of scanning every <a>/<div>
+def extractPostDetails_lxml(html):
+	root = lxml.html.fromstring(html)
+	postEle = root.xpath("(//shreddit-post)[1]")
+	if not postEle: return "", "", "" #Not a post page
+	postEle = postEle[0]
+
+	#Get title
+	title = ""; postId = ""
+	for t in postEle.xpath('.//h1[@slot="title"][starts-with(@id, "post-title")]'):
+		title = t.text_content()
+		postId = t.get("id").replace("post-title-","")
+
+	#Get user
+	user = ""
+	for u in postEle.xpath('.//a[@href][starts-with(normalize-space(@class), "author-name")]'):
+		user = u.get("href")
+
+	#Get description
+	desc = ""
+	for d in postEle.xpath(".//div[starts-with(@id, $prefix)]", prefix=postId+"-post-rtjson-content"):
+		for text in d.iter("p"):
+			desc += text.text_content() + " "
+	return title, desc, user
+
+#selectolax backend: lexbor parser + CSS selectors, fastest of the three
+def extractPostDetails_selectolax(html):
+	postEle = HTMLParser(html).css_first("shreddit-post")
+	if postEle is None: return "", "", "" #Not a post page
+
+	#Get title
+	title = ""; postId = ""
+	for t in postEle.css('h1[slot="title"][id^="post-title"]'):
+		title = t.text(deep=True)
+		postId = t.attributes["id"].replace("post-title-","")
+
+	#Get user
+	user = ""
+	for u in postEle.css('a[href][class^="author-name"]'):
+		user = u.attributes["href"]
+
+	#Get description
+	desc = ""
+	for d in postEle.css('div[id^="' + postId + '-post-rtjson-content"]'):
+		for text in d.css("p"):
+			desc += text.text(deep=True) + " "
+	return title, desc, user
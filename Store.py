@@ -0,0 +1,153 @@
+import threading
+import csv
+from pathlib import Path
+from urllib.parse import urlparse
+import Database
+
+"""
+Post store backed by SQLite. Posts are appended/upserted by URL instead of rewriting a whole CSV,
+tagged with the tickers they were scraped for, indexed by timestamp for time-range scans, and read
+back lazily with only the columns a caller asks for (e.g. url/title/description for prompting).
+Comment threads are streamed in alongside, keyed by comment id and indexed by post.
+
+@author Victor Gong
+@version 10/18/2026
+"""
+
+storeFileName = "data/posts.sqlite"
+
+POST_COLUMNS = ("url", "title", "description", "ts", "karma", "comments", "user") #Same order as the post tuple
+COMMENT_COLUMNS = ("postId", "commentId", "parentId", "user", "ts", "karma", "text") #Same order as Scraper.commentRecord
+COMMENT_WRITE_BATCH = 500 #Comments per transaction when writing a stream
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS posts (
+        url TEXT PRIMARY KEY, postId TEXT, title TEXT, description TEXT, ts TEXT,
+        karma INTEGER, comments INTEGER, user TEXT)""",
+    "CREATE INDEX IF NOT EXISTS posts_ts ON posts(ts)",
+    "CREATE INDEX IF NOT EXISTS posts_postId ON posts(postId)",
+    "CREATE TABLE IF NOT EXISTS tickers (ticker TEXT, url TEXT, PRIMARY KEY (ticker, url)) WITHOUT ROWID",
+    """CREATE TABLE IF NOT EXISTS comments (
+        commentId TEXT PRIMARY KEY, postId TEXT, parentId TEXT, user TEXT, ts TEXT, karma INTEGER, text TEXT)""",
+    "CREATE INDEX IF NOT EXISTS comments_post ON comments(postId)",
+)
+
+_local = threading.local()
+
+
+def getConnection():
+    return Database.connect(_local, storeFileName, SCHEMA)
+
+#Returns the subreddit (lowercase, e.g. wallstreetbets) from a post URL, "" if it isn't a subreddit URL
+def subredditFromURL(url):
+    parts = urlparse(url).path.split("/")
+    return parts[2].lower() if len(parts) > 2 and parts[1] == "r" else ""
+
+#Returns the post id (e.g. t3_1hgjsgd) from a post URL, "" if it isn't a post URL
+def postIdFromURL(url):
+    parts = urlparse(url).path.split("/")
+    if "comments" in parts and parts.index("comments")+1 < len(parts): return "t3_" + parts[parts.index("comments")+1]
+    return ""
+
+def toInt(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+"""
+=========================================================
+                        WRITING
+=========================================================
+"""
+
+#Inserts or updates posts by URL and tags them with tickers (a ticker name, or one collection of tickers per post)
+def upsertPosts(posts, tickers=None):
+    conn = getConnection()
+    count = 0
+    with conn:
+        for i, (url, title, description, ts, karma, comments, user) in enumerate(posts):
+            conn.execute("""INSERT INTO posts VALUES (?,?,?,?,?,?,?,?) ON CONFLICT(url) DO UPDATE SET
+                title=excluded.title, description=excluded.description, ts=excluded.ts,
+                karma=excluded.karma, comments=excluded.comments, user=excluded.user""",
+                (url, postIdFromURL(url), title, description, ts, toInt(karma), toInt(comments), user))
+            postTickers = [tickers] if isinstance(tickers, str) else (tickers[i] if tickers else [])
+            conn.executemany("INSERT OR IGNORE INTO tickers VALUES (?,?)", [(t, url) for t in postTickers])
+            count += 1
+    return count
+
+#Updates karma and # of comments from {postId -> (karma, comments)}
+def updateStats(stats):
+    conn = getConnection()
+    with conn:
+        conn.executemany("UPDATE posts SET karma=?, comments=? WHERE postId=?",
+                         [(toInt(karma), toInt(comments), postId) for postId, (karma, comments) in stats.items()])
+
+#Upserts comment records from any iterable (e.g. a Scraper.streamComments generator) COMMENT_WRITE_BATCH at a time,
+#so a stream is never held in memory; returns # of comments written
+def upsertComments(records):
+    conn = getConnection()
+    count = 0; chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= COMMENT_WRITE_BATCH:
+            writeComments(conn, chunk); count += len(chunk); chunk = []
+    writeComments(conn, chunk)
+    return count + len(chunk)
+
+def writeComments(conn, chunk):
+    with conn:
+        conn.executemany("""INSERT INTO comments VALUES (?,?,?,?,?,?,?) ON CONFLICT(commentId) DO UPDATE SET
+            karma=excluded.karma, text=excluded.text""",
+            [(commentId, postId, parentId, user, ts, karma, text) for postId, commentId, parentId, user, ts, karma, text in chunk])
+
+#One-time import of a legacy data/post_<stock>.csv into the store
+def importCSV(fileName, ticker):
+    with open(fileName, "r") as csvF:
+        count = upsertPosts(csv.reader(csvF), ticker)
+    print("Imported", count, "posts from", fileName, "as", ticker)
+    return count
+
+"""
+=========================================================
+                        READING
+=========================================================
+"""
+
+#Builds the WHERE clause for ticker/time-range filters
+def whereClause(ticker=None, start=None, end=None):
+    clauses = []; params = []
+    if ticker is not None: clauses.append("url IN (SELECT url FROM tickers WHERE ticker=?)"); params.append(ticker)
+    if start is not None: clauses.append("ts >= ?"); params.append(start)
+    if end is not None: clauses.append("ts < ?"); params.append(end)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+#Lazily yields posts as tuples of the requested columns, optionally for one ticker and a [start, end) ts range
+def loadPosts(columns=POST_COLUMNS, ticker=None, start=None, end=None):
+    for c in columns:
+        if c not in POST_COLUMNS + ("postId",): raise ValueError("Unknown post column: " + c)
+    where, params = whereClause(ticker, start, end)
+    yield from getConnection().execute("SELECT " + ", ".join(columns) + " FROM posts" + where + " ORDER BY rowid", params)
+
+#Lazily yields a post's comments as COMMENT_COLUMNS tuples, oldest first
+def loadComments(postId):
+    yield from getConnection().execute("SELECT " + ", ".join(COMMENT_COLUMNS) + " FROM comments WHERE postId=? ORDER BY ts", (postId,))
+
+#Returns {url -> (title, description, ts, karma, comments, user)} for the given URLs (missing ones are left out)
+def getPosts(urls, columns=POST_COLUMNS[1:]):
+    rows = Database.selectIn(getConnection(), "SELECT url, " + ", ".join(columns) + " FROM posts WHERE url IN ({})", urls)
+    return {row[0]: row[1:] for row in rows}
+
+def countPosts(ticker=None):
+    where, params = whereClause(ticker)
+    return getConnection().execute("SELECT COUNT(*) FROM posts" + where, params).fetchone()[0]
+
+#Writes one ticker's posts out in the legacy CSV layout, returns # of posts written
+def exportCSV(fileName, ticker=None):
+    Path(fileName).parent.mkdir(parents=True, exist_ok=True)
+    count = 0
+    with open(fileName, "w") as csvF:
+        csvWriter = csv.writer(csvF)
+        for post in loadPosts(ticker=ticker):
+            csvWriter.writerow(post); count += 1
+    return count
@@ -0,0 +1,81 @@
+import json
+import os
+import time
+from datetime import datetime
+
+"""
+Persistent seen-post index for incremental scraping. Remembers, per (subreddit, query) target,
+every post id already scraped (t3_ ids) and a high-water mark: the timestamp up to which every post
+of the listing has been scraped, so a listing crawl can stop as soon as it reaches known territory.
+The mark only moves once a crawl got all the way down to it; a crawl cut short by its cap leaves a
+gap, and the next crawl skips the posts it already has and carries on into the gap. Also tracks
+recent posts whose karma/comment counts still move and when they were last refreshed.
+
+@author Victor Gong
+@version 10/18/2026
+"""
+
+indexFileName = "data/seen_index.json"
+
+REFRESH_WINDOW = 48*3600 #Posts younger than this (seconds) keep getting karma/comment refreshes
+REFRESH_INTERVAL = 6*3600 #Min seconds between two refreshes of the same target
+
+
+#Reads the index from disk (empty index if it doesn't exist yet)
+def loadIndex(fileName=indexFileName):
+    if not os.path.exists(fileName): return {}
+    with open(fileName, "r") as f:
+        index = json.load(f)
+    for entry in index.values():
+        entry["ids"] = set(entry["ids"])
+        entry.setdefault("newest", entry["hwm"]) #Indexes written before the newest/hwm split
+    return index
+
+#Writes the index to disk atomically (temp file + rename so a crash can't leave it half-written)
+def saveIndex(index, fileName=indexFileName):
+    data = {key: dict(entry, ids=sorted(entry["ids"])) for key, entry in index.items()}
+    with open(fileName + ".tmp", "w") as f:
+        json.dump(data, f)
+    os.replace(fileName + ".tmp", fileName)
+
+#Returns the index entry for a (subreddit, query) target, creating it if needed
+def getTarget(index, subreddit, query):
+    key = subreddit + "|" + query
+    if key not in index: index[key] = {"hwm": "", "newest": "", "ids": set(), "recent": {}, "lastRefresh": 0}
+    return index[key]
+
+#Checks if a listing entry is at or below the high-water mark (everything from there down was scraped, the crawl can stop)
+def isKnown(entry, postId, ts):
+    return entry["hwm"] != "" and ts <= entry["hwm"]
+
+#Checks if a listing entry was already scraped (above the mark after a crawl cut short by its cap, skip it and go on)
+def isSeen(entry, postId):
+    return postId in entry["ids"]
+
+#Records a scraped post (the high-water mark only moves with markCovered)
+def markSeen(entry, postId, ts):
+    entry["ids"].add(postId)
+    entry["recent"][postId] = ts
+    if ts > entry["newest"]: entry["newest"] = ts
+
+#Advances the high-water mark to the newest post seen, once a crawl reached known territory or the end of the
+#listing (fewer new posts than its cap) or the entry was seeded from posts already stored
+def markCovered(entry):
+    if entry["newest"] > entry["hwm"]: entry["hwm"] = entry["newest"]
+
+#Converts a post timestamp (e.g. 2024-12-17T20:19:17.364000+0000) to epoch seconds
+def tsToEpoch(ts):
+    return datetime.strptime(ts, "%Y-%m-%dT%H:%M:%S.%f%z").timestamp()
+
+#Returns ids of posts still inside the refresh window (drops the ones that aged out)
+def recentIds(entry):
+    cutoff = time.time() - REFRESH_WINDOW
+    entry["recent"] = {postId: ts for postId, ts in entry["recent"].items() if ts and tsToEpoch(ts) >= cutoff}
+    return list(entry["recent"].keys())
+
+#Checks if a target's recent posts are due for a karma/comment refresh
+def dueForRefresh(entry):
+    return time.time() - entry["lastRefresh"] >= REFRESH_INTERVAL
+
+def markRefreshed(entry):
+    entry["lastRefresh"] = time.time()
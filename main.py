@@ -5,32 +5,53 @@ WallScrape Main Driver
 @version 12/17/2024
 """
 
+import argparse
+import contextlib
 import csv
-import Scraper
-from concurrent.futures import ThreadPoolExecutor
-import Visualizer
-import Analyzer
-import itertools
-import AutoPrinter as AP
+import os
+import Metrics
+import Tracker
+import Store
+import Responses
+#Scraper (requests/bs4), Scheduler, Analyzer (numpy, openai on first call), Relevance (nltk), Aggregate (pandas) and Pipeline
+#are imported inside the functions that use them, so each command only loads what it needs
 
 #INSTALL ALL LIBRARIES IN TERMINAL/COMMAND PROMPT WITH: pip install -r /path/to/requirements.txt
 
+#Usage: python main.py {scrape,classify,evaluate,aggregate,status} [options] (python main.py <command> -h for options)
+
 #Scrape Info
 targetStock = "nvidia"
+targetSubreddit = "wallstreetbets"
+scrapeMode = "json" #"json" (listing endpoint, no browser) or "browser" (Selenium scroll fallback)
+incremental = True #JSON mode only: stop at posts scraped on earlier runs (see Tracker.indexFileName)
+scrapeCap = 300 #Max posts per scrape
+scrapeTargets = [ #(subreddit, search query, ticker tag) for multi-ticker runs through Scheduler
+    ("wallstreetbets", "nvidia", "nvidia"),
+    ("wallstreetbets", "NVDA", "nvidia"),
+    ("stocks", "nvidia", "nvidia"),
+]
 targetSubPosts = "https://www.reddit.com/r/wallstreetbets/search/?q="+targetStock+"&type=posts&sort=new"
 targetSubComments = "https://www.reddit.com/r/wallstreetbets/search/?q="+targetStock+"&type=comments&sort=new"
 
 #Data files
-postsFileName = "data/post_"+targetStock+".csv" #Post URLs from subreddit
+postsFileFormat = "data/post_{}.csv" #Per-ticker post .csv, exported from Store after scrape --all
+postsFileName = postsFileFormat.format(targetStock) #Legacy post .csv, imported into Store on first load
 
 #Result files
 catStatsFileName = "results/category_stats.csv" #Topic categories of articles with frequency and average political lean
+bwFileName = Responses.resultsFileName("results/post_bw.csv", targetStock) #Same as Analyzer.BWFileName for targetStock
+evalFileName = Responses.resultsFileName("results/post_eval.csv", targetStock) #Same as Analyzer.EvalFileName for targetStock
 
 #Dictionaries
-postsDict = {} #Format: {url -> (title, description, ts, karma, comments, user)}
-postsList = [] #Format: [(url, title, description, ts, karma, comments, user),...]
+postsDict = {} #Format: {url -> (title, description, ts, karma, comments, user)}, posts scraped this run (pending writePosts)
+postsList = [] #Format: [(url, title, description, ts, karma, comments, user),...], target's posts loaded from Store
+seenIndex = None #Tracker index updated by an incremental scrape, saved by writePosts once the posts are stored
 
 
+#Prints a divider line around section headers
+def printLine():
+    print("=" * 57)
 
 """
 =========================================================
@@ -38,42 +59,83 @@ postsList = [] #Format: [(url, title, description, ts, karma, comments, user),..
 =========================================================
 """
 
-#Reads all content from the posts .csv and populates postDict (removes duplicates and updates existing post info)
+#Loads the target's posts from the post store into postsList (imports the legacy .csv the first time)
 def loadPosts():
-    with open(postsFileName, "r") as csvF:
-        csvReader = csv.reader(csvF)
-        csvContent = [line for line in csvReader]
-        for post in csvContent:
-            url, title, description, ts, karma, comments, user = post
-            postsDict[url] = (title, description, ts, karma, comments, user)
-            postsList.append((url, title, description, ts, karma, comments, user))
+    if Store.countPosts(targetStock) == 0 and os.path.exists(postsFileName):
+        Store.importCSV(postsFileName, targetStock)
+    postsList[:] = Store.loadPosts(ticker=targetStock)
 
 #Scrapes all posts from target subreddit and records in posts .csv
 def scrapePosts():
-    for p in Scraper.extractPosts(targetSubPosts):
+    import Scraper
+    if scrapeMode == "json" and incremental: return scrapeNewPosts()
+    if scrapeMode == "json": posts = Scraper.extractPostsJSON(targetSubreddit, targetStock, scrapeCap)
+    else: posts = Scraper.extractPosts(targetSubPosts)
+    for p in posts:
+        url, title, description, ts, karma, comments, user = p
+        postsDict[url] = (title, description, ts, karma, comments, user)
+
+#Scrapes only posts newer than the last run, then refreshes karma/comments of recent posts when due
+def scrapeNewPosts():
+    global seenIndex
+    import Scraper
+    import Scheduler
+    seenIndex = index = Tracker.loadIndex()
+    entry = Tracker.getTarget(index, targetSubreddit, targetStock)
+    if not entry["ids"]: Scheduler.seedFromStore(entry, targetSubreddit, targetStock) #First incremental run, seed the index with posts already stored
+    isKnown = lambda postId, ts: Tracker.isKnown(entry, postId, ts)
+    isSeen = lambda postId: Tracker.isSeen(entry, postId)
+
+    newCount = 0
+    for p in Scraper.extractPostsJSON(targetSubreddit, targetStock, scrapeCap, isKnown=isKnown, isSeen=isSeen):
         url, title, description, ts, karma, comments, user = p
         postsDict[url] = (title, description, ts, karma, comments, user)
+        Tracker.markSeen(entry, Store.postIdFromURL(url), ts)
+        newCount += 1
+    if newCount < scrapeCap: Tracker.markCovered(entry) #Reached known posts (or the end of the listing), no gap left
+    print("Incremental scrape:", newCount, "new posts")
+
+    if Tracker.dueForRefresh(entry):
+        stats = Scraper.fetchPostStats(Tracker.recentIds(entry))
+        Store.updateStats(stats)
+        Tracker.markRefreshed(entry)
+        print("Refreshed karma/comments for", len(stats), "recent posts")
+
+#Scrapes every target in scrapeTargets in one pass, stores the posts tagged with each matching ticker and
+#exports each ticker's stored posts to its own .csv (postsFileFormat)
+def scrapeAllTargets():
+    import Scheduler
+    Scheduler.scrapeAndStore(scrapeTargets, scrapeCap, incremental)
+    for ticker in sorted({target[2] for target in scrapeTargets}):
+        print("Exported", Store.exportCSV(postsFileFormat.format(ticker), ticker), ticker, "posts to", postsFileFormat.format(ticker))
+
+#Streams the comment threads of the target's stored posts into the post store (newest posts first, up to cap threads)
+def scrapeComments(cap=scrapeCap):
+    import Scheduler
+    posts = sorted(Store.loadPosts(("postId", "ts"), ticker=targetStock), key=lambda post: post[1], reverse=True)
+    Scheduler.crawlComments([postId for postId, ts in posts if postId][:cap])
 
-#Writes content in postDict to posts .csv
+#Upserts the posts scraped this run into the post store, then saves the seen-post index of an incremental scrape
+#(only after the store write, so posts are never marked seen without being stored)
 def writePosts():
-    print("Writing posts to file",postsFileName,"...")
-    with open(postsFileName, "w") as csvF:
-        csvWriter = csv.writer(csvF)
-        for url in postsDict.keys():
-            title, description, ts, karma, comments, user = postsDict[url]
-            csvWriter.writerow([url, title, description, ts, karma, comments, user])
-            print("Wrote ",url)
+    global seenIndex
+    count = Store.upsertPosts([(url,) + post for url, post in postsDict.items()], targetStock)
+    print("Wrote", count, "posts to", Store.storeFileName)
+    postsDict.clear()
+    if seenIndex is not None: Tracker.saveIndex(seenIndex); seenIndex = None
 
 """
 =========================================================
                      DATA ANALYSIS
 =========================================================
 **Note, 'send' methods append rather than overwrite to allow for several batches of processing
+**Progress lives in the ledger (Ledger.ledgerFileName): re-running a 'send' method resumes in-flight batches and skips posts already sent
 """
 
 #Sends a bulk request to Batch API for black-white political analysis of all articles
 def sendRequest_ArticlesBWPolitics(startIndex=0, confirmMsg=True):
-   AP.printLine(); print("Sending bulk request for BW analysis"); AP.printLine()
+   import Analyzer
+   printLine(); print("Sending bulk request for BW analysis"); printLine()
    print("Total post count:", len(postsList))
    #Send the request through Analyzer module
    Analyzer.createBatch_BWAnalysis(postsList, targetStock, startIndex, confirmMsg)
@@ -81,34 +143,128 @@ def sendRequest_ArticlesBWPolitics(startIndex=0, confirmMsg=True):
 
 #Sends a bulk request to Batch API for full political evaluation of white (politically-marked) articles
 def sendRequest_ArticlesEvalPolitics(startIndex=0, fileLineStart=1, confirmMsg=True):
-   AP.printLine(); print("Sending bulk request for evaluation"); AP.printLine()
+   import Analyzer
+   printLine(); print("Sending bulk request for evaluation"); printLine()
 
    #Read article information
    processList = []; postSet = set()
-   with open(Analyzer.BWFileName, "r") as csvF:
+   with open(bwFileName, "r") as csvF:
       csvReader = csv.reader(csvF)
-      csvContent = [line for line in csvReader]
+      csvContent = [line for line in csvReader][fileLineStart-1:]
+   postsInfo = Store.getPosts(articleInfo[0] for articleInfo in csvContent) #Only the posts being evaluated
 
-      for articleInfo in csvContent[fileLineStart-1:]:
-         url = articleInfo[0]
-         isPolitical = "y" in articleInfo[1].lower()
-         title, description, ts, karma, comments, user = postsDict[url]
+   for articleInfo in csvContent:
+      url = articleInfo[0]
+      isPolitical = Responses.isRelated(articleInfo)
+      title, description, ts, karma, comments, user = postsInfo[url]
 
-         #Check if article related to politics (from BW analysis) and prevent repetitions
-         if isPolitical and url not in postSet:
-            processList.append((url, title, description, ts, karma, comments, user)) #Append to table
-            postSet.add(url)
+      #Check if article related to politics (from BW analysis) and prevent repetitions
+      if isPolitical and url not in postSet:
+         processList.append((url, title, description, ts, karma, comments, user)) #Append to table
+         postSet.add(url)
     
    print("Total article count:", len(processList))
    #Send the request through Analyzer module
    Analyzer.createBatch_Eval(processList, targetStock, startIndex, confirmMsg)
 
+"""
+=========================================================
+                     CALCULATIONS
+=========================================================
+"""
+
+#Folds new evaluation results into the running aggregates and prints overall and rolling-window optimism
+def aggregateSentiment(window="24h"):
+   import Aggregate
+   printLine(); print("Aggregating evaluation results"); printLine()
+   Aggregate.update(evalFileName)
+   print(Aggregate.overall().to_string())
+   print(Aggregate.timeSeries(window).dropna(subset=["mean"]).tail(10).to_string())
+
+"""
+=========================================================
+                        STATUS
+=========================================================
+"""
+
+#Prints stored posts, the scrape high-water mark, batch progress in the ledger and result counts (SQLite/.csv reads only)
+def printStatus():
+   import Ledger
+   printLine(); print("Status for", targetStock); printLine()
+   if os.path.exists(Store.storeFileName):
+      print("Posts stored:", Store.countPosts(), "|", targetStock + ":", Store.countPosts(targetStock), "| comments:", Store.getConnection().execute("SELECT COUNT(*) FROM comments").fetchone()[0])
+   else:
+      print("Posts stored: none yet")
+   entry = Tracker.loadIndex().get(targetSubreddit + "|" + targetStock) if os.path.exists(Tracker.indexFileName) else None
+   if entry: print("Incremental scrape of r/" + targetSubreddit, targetStock, "| newest post:", entry["newest"] or "-", "| covered up to:", entry["hwm"] or "-", "|", len(entry["ids"]), "posts seen")
+   if os.path.exists(Ledger.ledgerFileName):
+      for kind in ("bw", "eval"):
+         counts = Ledger.stateCounts(kind)
+         print("Ledger", kind.ljust(4), "|", ", ".join(state + ": " + str(n) for state, n in sorted(counts.items())) or "empty",
+               "|", len(Ledger.inFlightBatches(kind)), "batches in flight")
+   for label, fileName in [("BW results", bwFileName), ("Eval results", evalFileName)]:
+      if not os.path.exists(fileName): print(label + ": none yet"); continue
+      with open(fileName, "r") as csvF:
+         rows = [row for row in csv.reader(csvF) if len(row) >= 2]
+      related = " | related: " + str(sum(Responses.isRelated(row) for row in rows)) if fileName == bwFileName else ""
+      print(label + ":", len(rows), "rows" + related)
+
 """<<Control Center>>"""
 
-#===Post scraping===#
-#scrapePosts(); writePosts()
+#Command line, e.g. from cron: python main.py scrape --all && python main.py classify --yes && python main.py evaluate --yes
+#(scrape -> classify -> evaluate in one run: python Pipeline.py --stock nvidia --target wallstreetbets nvidia)
+def main(argv=None):
+   global scrapeCap
+   parser = argparse.ArgumentParser(description="WallScrape: scrape Reddit posts, classify/evaluate them with the Batch API, aggregate sentiment")
+   commands = parser.add_subparsers(dest="command", required=True)
+
+   scrape = commands.add_parser("scrape", help="scrape posts of the target (or every target) into the post store")
+   scrape.add_argument("--all", action="store_true", help="scrape every target in scrapeTargets")
+   scrape.add_argument("--comments", action="store_true", help="also stream the comment threads of stored posts")
+   scrape.add_argument("--cap", type=int, default=scrapeCap, help="max posts per target (and comment threads with --comments)")
+   scrape.add_argument("--offline", action="store_true", help="replay responses from the HTTP cache only, never touch the network")
+
+   classify = commands.add_parser("classify", help="send the target's posts for BW (related Y/N) analysis")
+   classify.add_argument("--start-index", type=int, default=0)
+   classify.add_argument("--yes", action="store_true", help="don't ask for confirmation before submitting")
+   classify.add_argument("--precision-recall", action="store_true", help="only report the local prefilter against historical BW labels")
+
+   evaluate = commands.add_parser("evaluate", help="send the posts BW analysis found related for evaluation")
+   evaluate.add_argument("--start-index", type=int, default=0)
+   evaluate.add_argument("--line-start", type=int, default=1, help="first BW results line to read")
+   evaluate.add_argument("--yes", action="store_true", help="don't ask for confirmation before submitting")
+
+   aggregate = commands.add_parser("aggregate", help="fold new evaluation results into the aggregates and print them")
+   aggregate.add_argument("--window", default="24h", help="rolling window, e.g. 24h or 7D")
+
+   commands.add_parser("status", help="print stored posts, batch progress and result counts")
+   for command in (scrape, classify, evaluate):
+      command.add_argument("--profile", choices=["cprofile", "pyinstrument"], help="profile the run (saved to " + Metrics.profileFileName + ".prof/.html)")
+   args = parser.parse_args(argv)
+   if args.command == "scrape": scrapeCap = args.cap
+   if args.command == "scrape" and args.offline:
+      import Cache
+      Cache.OFFLINE = True
+
+   if args.command == "status": return printStatus()
+   if args.command == "aggregate": return aggregateSentiment(args.window)
+   if args.command == "classify" and args.precision_recall:
+      import Relevance
+      return Relevance.reportPrecisionRecall(targetStock, bwFileName)
+
+   with Metrics.profile(backend=args.profile) if args.profile else contextlib.nullcontext():
+      if args.command == "scrape":
+         if args.all: scrapeAllTargets()
+         else: loadPosts(); scrapePosts(); writePosts()
+         if args.comments: scrapeComments(args.cap)
+      elif args.command == "classify":
+         loadPosts(); sendRequest_ArticlesBWPolitics(args.start_index, not args.yes)
+      elif args.command == "evaluate":
+         sendRequest_ArticlesEvalPolitics(args.start_index, args.line_start, not args.yes)
+
+   #Fetch/parse latency, HTTP status, cache hit rate, planned vs billed tokens
+   Metrics.report(); Metrics.writeJSON(); Metrics.writePrometheus()
+
 
-#===AI Analysis===#
-loadPosts()
-sendRequest_ArticlesBWPolitics()
-#===Calculations/Visualization===#
+if __name__ == "__main__":
+   main()